@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 10:05:41 2026
+
+@author: talespadilha
+"""
+
+import os
+import sys
+import json
+import inspect
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+import support_functions as sf
+import transform_data as td
+import construct_sub_idx as csi
+import construct_index as ci
+import fx_analysis as fx
+
+# Benchmark sizes: countries, years and variables of the synthetic inputs
+SIZES = {
+    'small': {'n_countries': 50, 'n_years': 20, 'n_vars': 18},
+    'medium': {'n_countries': 200, 'n_years': 60, 'n_vars': 30},
+    'large': {'n_countries': 250, 'n_years': 60, 'n_vars': 60},
+}
+# Cold start budget (seconds) for importing the index-only path
+IMPORT_BUDGET = 1.0
+# Heavy dependencies that should only be loaded on first use
+LAZY_DEPS = ('sklearn', 'statsmodels', 'openpyxl', 'xlrd')
+# Timed calls per stage (the best one is kept)
+REPEAT = 5
+# Smallest increases reported as regressions, whatever their ratio, so
+# millisecond stages are not judged on noise
+MIN_DELTA = {'wall_s': 0.1, 'peak_mb': 1.0}
+
+
+def synthetic_panel(n_countries: int = 200, n_years: int = 60, n_vars: int = 30,
+                    missing: float = 0.2, seed: int = 0) -> pd.DataFrame:
+    """Builds a random (subindex, variable, country) panel like final_df
+
+    Args:
+        n_countries: int with the number of countries.
+        n_years: int with the number of years.
+        n_vars: int with the number of variables, spread over six subindices.
+        missing: float with the share of missing observations.
+        seed: int with the random seed.
+
+    Returns:
+        df: pd.DataFrame with yearly index and three column levels
+    """
+    rng = np.random.default_rng(seed)
+    subidx = ['institutions', 'culture', 'comercial', 'digital', 'global_reach', 'education']
+    countries = [f'C{i:03d}' for i in range(n_countries)]
+    cols = []
+    for i in range(n_vars):
+        # Each variable covers a random ~90% of the countries
+        covered = [c for c in countries if rng.random() < 0.9]
+        cols += [(subidx[i % len(subidx)], f'var{i}', c) for c in covered]
+    columns = pd.MultiIndex.from_tuples(cols, names=['subindex', 'variable', 'country'])
+    index = pd.date_range('1960-01-01', periods=n_years, freq='YS')
+    values = rng.lognormal(size=(n_years, len(cols)))
+    values[rng.random(values.shape) < missing] = np.nan
+    df = pd.DataFrame(values, index=index, columns=columns)
+
+    return df
+
+
+def loop_min_max_norm(df_entry: pd.DataFrame) -> pd.DataFrame:
+    """Reference min-max normalisation with the original subindex x variable loop"""
+    df = df_entry.copy()
+    subidx = list(set(df.columns.get_level_values('subindex')))
+    for idx in subidx:
+        si_df = df.xs(idx, axis=1, level='subindex')
+        var_set = list(set(si_df.columns.get_level_values('variable')))
+        for var in var_set:
+            sample = si_df.xs(var, axis=1, level='variable')
+            maxi = sample.max(axis=1)
+            mini = sample.min(axis=1)
+            norm = sample.sub(mini, axis='index').div(maxi-mini, axis='index')
+            df[(idx, var)] = norm.copy()
+
+    return df
+
+
+def loop_z_norm(df_entry: pd.DataFrame) -> pd.DataFrame:
+    """Reference z score normalisation with the original subindex x variable loop"""
+    df = df_entry.copy()
+    subidx = list(set(df.columns.get_level_values('subindex')))
+    for idx in subidx:
+        si_df = df.xs(idx, axis=1, level='subindex')
+        var_set = list(set(si_df.columns.get_level_values('variable')))
+        for var in var_set:
+            sample = si_df.xs(var, axis=1, level='variable')
+            mean = sample.median(axis=1)
+            std = sample.std(axis=1)
+            norm = sample.sub(mean, axis='index').div(std, axis='index')
+            df[(idx, var)] = norm.copy()
+
+    return df
+
+
+def timeit(func, *args, repeat: int = 3, **kwargs):
+    """Returns the best wall time of repeat calls and the last output"""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(*args, **kwargs)
+        best = min(best, time.perf_counter()-t0)
+
+    return best, out
+
+
+def bench_norm(df: pd.DataFrame, repeat: int = 3) -> pd.DataFrame:
+    """Compares the vectorised normalisers against the original loops"""
+    pairs = {'z_norm': (loop_z_norm, td.z_norm),
+             'min_max_norm': (loop_min_max_norm, td.min_max_norm)}
+    results = {}
+    for name, (loop_f, vec_f) in pairs.items():
+        t_loop, expected = timeit(loop_f, df, repeat=repeat)
+        t_vec, out = timeit(vec_f, df, repeat=repeat)
+        diff = np.nanmax(np.abs(expected.to_numpy()-out.to_numpy()))
+        results[name] = {'loop_s': t_loop, 'vectorised_s': t_vec,
+                         'speedup': t_loop/t_vec, 'max_abs_diff': diff}
+    results = pd.DataFrame(results).T
+
+    return results
+
+
+def synthetic_wdi(files_path: str, file_name: str, series: list, n_countries: int,
+                  n_years: int, seed: int = 0):
+    """Writes a WDI-style workbook (one row per country and series)"""
+    rng = np.random.default_rng(seed)
+    years = [f'{y} [YR{y}]' for y in range(2020-n_years, 2020)]
+    countries = [f'C{i:03d}' for i in range(n_countries)]
+    index = pd.MultiIndex.from_product([countries, series], names=['Country Code', 'Series Name'])
+    values = rng.lognormal(10, 2, size=(len(index), n_years)).astype(object)
+    values[rng.random(values.shape) < 0.2] = '..'
+    df = pd.DataFrame(values, index=index, columns=years).reset_index()
+    df.insert(0, 'Country Name', df['Country Code'])
+    df.insert(3, 'Series Code', df['Series Name'].str[:8])
+    df.to_excel(files_path+file_name, index=False)
+
+
+def synthetic_icrg(files_path: str, n_countries: int, n_years: int, seed: int = 0):
+    """Writes an ICRG-style workbook with monthly ratings"""
+    rng = np.random.default_rng(seed)
+    variables = ['Bureaucracy Quality (L)', 'Democratic Accountability (K)',
+                 'Government Stability (A)', 'Law & Order (I)', 'Corruption (F)']
+    months = pd.date_range(f'{2020-n_years}-01-01', periods=12*n_years, freq='MS').strftime('%m/%Y')
+    countries = [f'C{i:03d}' for i in range(n_countries)]
+    index = pd.MultiIndex.from_tuples([(c, c, v) for c in countries for v in variables],
+                                      names=['Country', 'Code', 'Variable'])
+    df = pd.DataFrame(rng.integers(0, 12, size=(len(index), len(months))), index=index, columns=months)
+    df.reset_index().to_excel(files_path+'ICRG.xlsx', index=False)
+
+
+def synthetic_gdelt(files_path: str, n_countries: int, n_years: int, seed: int = 0):
+    """Writes the gdelt_dc and gdelt_all event count csvs"""
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product([range(2019-n_years, 2019), [f'C{i:03d}' for i in range(n_countries)]],
+                                       names=['year', 'country'])
+    all_counts = rng.integers(100, 10000, size=len(index))
+    pd.DataFrame({'count': rng.binomial(all_counts, 0.05)}, index=index).to_csv(files_path+'gdelt_dc.csv')
+    pd.DataFrame({'count': all_counts}, index=index).to_csv(files_path+'gdelt_all.csv')
+
+
+def synthetic_reer(n_countries: int, n_years: int, seed: int = 0) -> pd.DataFrame:
+    """Builds a monthly IMF-style REER frame (as returned by imf_import)"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(f'{2020-n_years}-01-01', periods=12*n_years, freq='MS')
+    shocks = rng.normal(0, 0.02, size=(len(index), n_countries))
+    df = pd.DataFrame(100*np.exp(np.cumsum(shocks, axis=0)), index=index,
+                      columns=[f'C{i:03d}' for i in range(n_countries)])
+
+    return df
+
+
+def measure(func, *args, repeat: int = REPEAT, **kwargs) -> tuple:
+    """Returns the best wall time of repeat calls of func (see timeit), its
+    peak traced memory from a separate call and its output"""
+    wall, out = timeit(func, *args, repeat=repeat, **kwargs)
+    # Memory is traced apart, as tracemalloc slows the traced code down
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'wall_s': wall, 'peak_mb': peak/1e6}, out
+
+
+def warm_up():
+    """Loads the dependencies stages import lazily, so their first timed
+    call does not pay for the import"""
+    from sklearn.decomposition import PCA  # noqa: F401
+
+
+def _uncached_wb_import(files_path: str) -> pd.DataFrame:
+    """wb_import without the parquet cache and the in-process WB panel, so
+    every timed call parses the workbook"""
+    sf._WB_CACHE.clear()
+
+    return inspect.unwrap(td.wb_import)(files_path)
+
+
+def run_suite(n_countries: int, n_years: int, n_vars: int, seed: int = 0,
+              repeat: int = REPEAT) -> dict:
+    """Times every pipeline stage on synthetic inputs of the given size.
+
+    Lazy dependencies are loaded first and each stage keeps its best time
+    of repeat calls. Importers are only timed if an Excel writer is
+    installed, and run without their parquet cache.
+
+    Returns:
+        results: dict with the wall time and peak memory of each stage
+    """
+    warm_up()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        files_path = tmp+os.sep
+        # Raw source importers
+        synthetic_gdelt(files_path, n_countries, n_years, seed)
+        results['gdelt_import'], _ = measure(inspect.unwrap(td.gdelt_import), files_path)
+        try:
+            series = [td.POP, td.GDP]+[x[0] for x in td.WB_SPEC]
+            synthetic_wdi(files_path, 'WB.xlsx', series, n_countries, n_years, seed)
+            synthetic_icrg(files_path, n_countries, n_years, seed)
+        except ImportError:
+            pass
+        else:
+            results['wb_import'], _ = measure(_uncached_wb_import, files_path)
+            results['icrg_import'], _ = measure(inspect.unwrap(td.icrg_import), files_path)
+    # Index stages
+    panel = synthetic_panel(n_countries, n_years, n_vars, seed=seed).ffill()
+    results['z_norm'], z_scores = measure(td.z_norm, panel)
+    results['min_max_norm'], _ = measure(td.min_max_norm, panel)
+    results['calculate_weights'], weights = measure(csi.calculate_weights, z_scores)
+    results['calculate_sub'], sub_indices = measure(csi.calculate_sub, z_scores, weights)
+    results['calc_index'], _ = measure(ci.calc_index, sub_indices)
+    # FX volatility
+    reer = synthetic_reer(n_countries, n_years, seed)
+    results['reer_vol'], _ = measure(fx.reer_vol, reer)
+
+    return results
+
+
+def cold_start(modules: str = 'pipeline, construct_index', repeat: int = 5) -> dict:
+    """Best time to import modules in a fresh interpreter, and the LAZY_DEPS
+    the import loaded"""
+    code = ('import sys, time; t0 = time.perf_counter(); '
+            f'import {modules}; print(time.perf_counter()-t0); '
+            f'print(",".join(m for m in {LAZY_DEPS!r} if m in sys.modules))')
+    best = np.inf
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split('\n')
+        best = min(best, float(out[0]))
+    loaded = [m for m in out[1].split(',') if m]
+
+    return {'wall_s': best, 'loaded': loaded}
+
+
+def write_results(results: dict, file: str, size: dict):
+    """Writes benchmark results with the run's metadata to a json file"""
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'size': size,
+              'python': platform.python_version(), 'numpy': np.__version__,
+              'pandas': pd.__version__, 'results': results}
+    with open(file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.2,
+            min_delta: dict = MIN_DELTA) -> pd.DataFrame:
+    """Compares two benchmark reports and flags stages slower (or using more
+    memory) than the baseline by more than threshold and by more than the
+    min_delta floor"""
+    cur = pd.DataFrame(current['results']).T[['wall_s', 'peak_mb']].astype(float)
+    base = pd.DataFrame(baseline['results']).T.reindex(cur.index)[['wall_s', 'peak_mb']].astype(float)
+    df = pd.concat({'current': cur, 'baseline': base}, axis=1)
+    ratio = cur/base
+    df[('ratio', 'wall_s')] = ratio['wall_s']
+    df[('ratio', 'peak_mb')] = ratio['peak_mb']
+    worse = (ratio > 1+threshold) & (cur-base > pd.Series(min_delta))
+    df['regression'] = worse.any(axis=1)
+
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the soft power pipeline on synthetic data')
+    parser.add_argument('--size', default='medium', choices=SIZES)
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='timed calls per stage')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative increase over the baseline reported as a regression')
+    parser.add_argument('--baseline', help='previous json results to compare against')
+    parser.add_argument('--norm', action='store_true', help='also compare normalisers with the original loops')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='cold start budget in seconds for the index-only path')
+    args = parser.parse_args()
+    size = SIZES[args.size]
+    results = run_suite(**size, repeat=args.repeat)
+    start = cold_start()
+    results['cold_start'] = {'wall_s': start['wall_s'], 'peak_mb': None}
+    write_results(results, args.out, size)
+    print(pd.DataFrame(results).T)
+    failed = start['wall_s'] > args.import_budget or len(start['loaded']) > 0
+    if failed:
+        print(f"Cold start over budget ({start['wall_s']:.2f}s > {args.import_budget:.2f}s) "
+              f"or loaded {start['loaded']}")
+    if args.norm:
+        print(bench_norm(synthetic_panel(**size)))
+    if args.baseline:
+        with open(args.out) as f, open(args.baseline) as g:
+            comparison = compare(json.load(f), json.load(g), args.threshold)
+        print(comparison)
+        failed = failed or comparison['regression'].any()
+    sys.exit(int(failed))
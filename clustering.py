@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:48:10 2026
+
+@author: talespadilha
+"""
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from panel import Panel
+
+
+def yearly_samples(data) -> dict:
+    """Returns {date: (countries, X)} with the (countries, sub-indices)
+    matrix of every date, keeping countries observed on all sub-indices"""
+    panel = data if isinstance(data, Panel) else Panel.from_frame(data)
+    samples = {}
+    for t, date in enumerate(panel.dates):
+        X = panel.values[t].T
+        keep = ~np.isnan(X).any(axis=1)
+        if keep.any():
+            samples[date] = (panel.countries[keep], X[keep])
+
+    return samples
+
+
+def fit_grid(data, k_range=range(1, 11), n_init: int = 10, seed: int = None,
+             n_jobs: int = None) -> dict:
+    """Fits KMeans for every date and number of clusters in parallel.
+
+    Each (date, k) fit gets its own seed spawned from seed, so results do not
+    depend on n_jobs. Values of k above the number of countries of a date
+    are skipped.
+
+    Args:
+        data: pd.DataFrame (dates x (subindex, country)) or Panel with the
+            sub-indices.
+        k_range: iterable with the numbers of clusters.
+        n_init: int with the KMeans initialisations per fit.
+        seed: int with the random seed.
+        n_jobs: int with the number of threads.
+
+    Returns:
+        grid: dict with the yearly 'samples' (see yearly_samples), the
+            sub-index names ('features') and the 'fits', a dict
+            {(date, k): (labels, centers, inertia)}
+    """
+    from sklearn.cluster import KMeans
+
+    panel = data if isinstance(data, Panel) else Panel.from_frame(data)
+    samples = yearly_samples(panel)
+    tasks = [(date, k) for date, (_, X) in samples.items() for k in k_range if k <= len(X)]
+    seeds = np.random.SeedSequence(seed).generate_state(len(tasks))
+
+    def fit(task, task_seed):
+        date, k = task
+        km = KMeans(n_clusters=k, n_init=n_init, random_state=int(task_seed)).fit(samples[date][1])
+        return km.labels_, km.cluster_centers_, km.inertia_
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        fits = dict(zip(tasks, pool.map(fit, tasks, seeds)))
+
+    return {'samples': samples, 'features': panel.variables, 'fits': fits}
+
+
+def silhouettes(X: np.ndarray, labels: list) -> np.ndarray:
+    """Mean silhouette of several labelings of X at once.
+
+    Pairwise distances are computed once, and the distance sums from every
+    point to every cluster of every labeling come from a single product with
+    the stacked one-hot label matrices.
+
+    Args:
+        X: np.ndarray with shape (points, features).
+        labels: list of np.ndarrays with the cluster of every point.
+
+    Returns:
+        scores: np.ndarray with the mean silhouette of each labeling (nan
+            for less than two clusters)
+    """
+    sq = (X**2).sum(axis=1)
+    D = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2*X @ X.T, 0))
+    np.fill_diagonal(D, 0)
+    ks = [int(lab.max())+1 for lab in labels]
+    offsets = np.concatenate([[0], np.cumsum(ks)])
+    onehot = np.zeros((len(X), offsets[-1]))
+    for lab, off in zip(labels, offsets):
+        onehot[np.arange(len(X)), off+lab] = 1
+    sums = D @ onehot
+    sizes = onehot.sum(axis=0)
+    scores = np.full(len(labels), np.nan)
+    rows = np.arange(len(X))
+    for i, lab in enumerate(labels):
+        if ks[i] < 2:
+            continue
+        block = sums[:, offsets[i]:offsets[i+1]]
+        n = sizes[offsets[i]:offsets[i+1]]
+        own = n[lab]
+        # Mean distance to the own cluster and to the nearest other one
+        a = block[rows, lab]/np.maximum(own-1, 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            other = np.where(n > 0, block/n, np.inf)
+        other[rows, lab] = np.inf
+        b = other.min(axis=1)
+        s = np.where(own > 1, (b-a)/np.maximum(a, b), 0)
+        scores[i] = np.nan_to_num(s).mean()
+
+    return scores
+
+
+def curves(grid: dict) -> pd.DataFrame:
+    """Returns the inertia and silhouette of every fit, indexed by (date, k)"""
+    rows = {}
+    for date, (_, X) in grid['samples'].items():
+        ks = [k for d, k in grid['fits'] if d == date]
+        if not ks:
+            continue
+        scores = silhouettes(X, [grid['fits'][(date, k)][0] for k in ks])
+        for k, score in zip(ks, scores):
+            rows[(date, k)] = {'inertia': grid['fits'][(date, k)][2], 'silhouette': score}
+    df = pd.DataFrame.from_dict(rows, orient='index')
+    df.index = df.index.set_names(['date', 'k'])
+
+    return df
+
+
+def align_labels(grid: dict, k: int) -> tuple:
+    """Relabels the k cluster fits so that labels match across dates.
+
+    Clusters of the first date are numbered by decreasing mean centre (0 is
+    the cluster with the highest sub-indices) and every later date is
+    matched to the previous one by the assignment of centres with the
+    smallest total distance (Hungarian algorithm).
+
+    Returns:
+        labels: pd.DataFrame (dates x countries) with the aligned clusters
+            (nan where a country was not clustered).
+        centers: pd.DataFrame indexed by (date, cluster) with the centres
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    dates = [d for d in grid['samples'] if (d, k) in grid['fits']]
+    countries = pd.Index(sorted(set().union(*[grid['samples'][d][0] for d in dates])))
+    labels = np.full((len(dates), len(countries)), np.nan)
+    centers = {}
+    prev = None
+    for t, date in enumerate(dates):
+        lab, cen, _ = grid['fits'][(date, k)]
+        if prev is None:
+            perm = np.argsort(np.argsort(-cen.mean(axis=1)))
+        else:
+            cost = np.sqrt(((cen[:, None, :] - prev[None, :, :])**2).sum(axis=2))
+            new, old = linear_sum_assignment(cost)
+            perm = np.empty(k, dtype=int)
+            perm[new] = old
+        ordered = np.empty_like(cen)
+        ordered[perm] = cen
+        prev = ordered
+        labels[t, countries.get_indexer(grid['samples'][date][0])] = perm[lab]
+        centers[date] = pd.DataFrame(ordered, index=pd.RangeIndex(k, name='cluster'),
+                                     columns=grid['features'])
+    labels = pd.DataFrame(labels, index=pd.Index(dates), columns=countries)
+    centers = pd.concat(centers, names=['date'])
+
+    return labels, centers
+
+
+def attach(df: pd.DataFrame, labels, country_level=1, date_level=None,
+           name: str = 'cluster') -> pd.DataFrame:
+    """Adds cluster membership to a df with a (date, country) MultiIndex.
+
+    Args:
+        df: pd.DataFrame with a MultiIndex holding countries (and dates).
+        labels: pd.Series of clusters by country (the same membership for
+            every date) or pd.DataFrame (dates x countries) from align_labels.
+        country_level: level (position or name) with the countries.
+        date_level: level (position or name) with the dates; required when
+            labels is a df.
+        name: str with the new column's name.
+
+    Returns:
+        df: copy of df with the cluster column
+    """
+    countries = labels.index if isinstance(labels, pd.Series) else labels.columns
+    cc_pos = countries.get_indexer(df.index.get_level_values(country_level))
+    values = labels.to_numpy(dtype=float)
+    if isinstance(labels, pd.Series):
+        cluster = values[cc_pos]
+        found = cc_pos >= 0
+    else:
+        t_pos = labels.index.get_indexer(df.index.get_level_values(date_level))
+        found = (cc_pos >= 0) & (t_pos >= 0)
+        cluster = values[t_pos, cc_pos]
+    df = df.copy()
+    df[name] = np.where(found, cluster, np.nan)
+
+    return df
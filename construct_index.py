@@ -9,13 +9,18 @@ Created on Mon Mar 22 12:36:04 2021
 import pandas as pd
 import os
 
+import storage
+import instrument
+from panel import Panel
 
+
+@instrument.stage()
 def calc_index(sub_idx):
-    """Aggregates final index"""
-    stacked_df=sub_idx.stack('country')
-    stacked_idx = stacked_df.mean(axis=1, skipna=False)
-    #(stacked_df.isna().sum(axis=1)<3).sum()
-    df_index = stacked_idx.unstack('country')
+    """Aggregates final index from a sub-indices df or Panel"""
+    panel = sub_idx if isinstance(sub_idx, Panel) else Panel.from_frame(sub_idx)
+    # Any missing sub-index leaves the country-date missing
+    values = panel.values.mean(axis=1)
+    df_index = pd.DataFrame(values, index=panel.dates, columns=panel.countries)
     final_df = df_index.dropna(how='all').dropna(axis=1, how='all')
     
     return final_df
@@ -24,8 +29,9 @@ def calc_index(sub_idx):
 if __name__ == '__main__':
     # Setting path and reading data
     os.chdir('/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data')
-    data = pd.read_csv('sub_indices.csv', header = [0,1], index_col = [0], parse_dates=True)
+    data = storage.open_panel('sub_indices')
     # Calculating final index
     final_index = calc_index(data)
     # Exporting
     final_index.to_csv('index.csv')
+    storage.write_panel(final_index, 'index', name='index')
@@ -9,12 +9,22 @@ Created on Mon Mar  1 15:58:33 2021
 import numpy as np
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from sklearn.decomposition import PCA
+import storage
+import instrument
+from panel import Panel
+
+# Number of principal components kept for each sub-index
+PC_N = {'institutions': 3, 'culture': 2, 'comercial': 3, 'digital': 2, 'global_reach': 3,
+        'education': 2}
 
 
 def pca_analysis(df: pd.DataFrame, n_comp: int):
     """Returns variance ratio and weights for PCA given number of components"""
+    # sklearn is only loaded when weights are estimated
+    from sklearn.decomposition import PCA
+
     pca = PCA(n_components=n_comp)
     pca.fit(df)
     var_ratio = pca.explained_variance_ratio_
@@ -24,52 +34,189 @@ def pca_analysis(df: pd.DataFrame, n_comp: int):
     return var_ratio, w, eigenvalues
 
 
-def calculate_weights(data: pd.DataFrame):  
+@instrument.stage()
+def calculate_weights(data):  
     """Calculates weights based on the PCA framework"""
+    panel = data if isinstance(data, Panel) else Panel.from_frame(data)
     # Looping over sub-indices
-    sub_idxs = data.columns.get_level_values('subindex').unique()
+    sub_idxs = panel.subindices
     final_w = {}
-    # Setting number of PCs found in analysis
-    PC_n = pd.Series([3,2,3,2,3,2], index = sub_idxs)
     for idx in sub_idxs:
         # Selecting data
-        idx_data = data.xs(idx, axis=1, level='subindex')
-        # Stacking data
-        pooled_data = idx_data.stack('country')
+        idx_data = panel.subindex(idx)
+        # Pooling data over dates and countries
+        pooled_data = idx_data.pooled()
         # Droping nas
-        all_nonna = pooled_data.dropna(how='any')
+        all_nonna = pooled_data[~np.isnan(pooled_data).any(axis=1)]
         # Running PCA
-        vr, w, _ = pca_analysis(all_nonna, PC_n[idx])
+        vr, w, _ = pca_analysis(all_nonna, PC_N[idx])
         # Getting weights
-        weights = pd.DataFrame(w, columns=all_nonna.columns)
-        # Dropping weights less than 0.1 - not in this version
-        weights[weights<0.10] = 0
-        # Using PCs to ws to build final weights
-        sm =np.zeros(weights.shape[1])
-        for i in range(len(vr)):
-            sm = sm + vr[i]*weights.loc[i]
-        final_w[idx] = sm / sm.sum()
+        final_w[idx] = pd.Series(combine_weights(vr, w), index=idx_data.variables)
         
     return final_w
+
+
+def combine_weights(var_ratio: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Builds variable weights from the PCs' variance ratios and squared
+    loadings; works on (k,) and (k, vars) arrays or stacks of them"""
+    # Dropping weights less than 0.1 - not in this version
+    w = np.where(w<0.10, 0, w)
+    # Using PCs to ws to build final weights
+    sm = np.einsum('...k,...kv->...v', var_ratio, w)
+
+    return sm / sm.sum(axis=-1, keepdims=True)
+
+
+def _bootstrap_batch(X: np.ndarray, n_comp: int, size: int, seed) -> np.ndarray:
+    """Computes PCA weights for size bootstrap resamples of the rows of X"""
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    # Resamples as row counts, so covariances come from one matrix product
+    draws = rng.integers(0, n, size=(size, n)) + n*np.arange(size)[:, None]
+    counts = np.bincount(draws.ravel(), minlength=size*n).reshape(size, n).astype(float)
+    X = X - X.mean(axis=0)
+    outer = (X[:, :, None]*X[:, None, :]).reshape(n, -1)
+    sums = (counts @ outer).reshape(size, X.shape[1], X.shape[1])
+    means = counts @ X / n
+    cov = (sums - n*means[:, :, None]*means[:, None, :]) / (n-1)
+    # Eigendecomposition of all resamples at once (ascending eigenvalues)
+    eigval, eigvec = np.linalg.eigh(cov)
+    var_ratio = eigval[:, ::-1][:, :n_comp] / eigval.sum(axis=1, keepdims=True)
+    w = np.swapaxes(eigvec[:, :, ::-1][:, :, :n_comp], 1, 2)**2
+
+    return combine_weights(var_ratio, w)
+
+
+@instrument.stage()
+def bootstrap_weights(data, n_boot: int = 1000, seed: int = None,
+                      percentiles: tuple = (2.5, 50, 97.5), batch_size: int = 250,
+                      n_jobs: int = None) -> pd.DataFrame:
+    """Bootstraps the PCA weights of every sub-index.
+
+    Rows of the pooled (date, country) data are resampled with replacement
+    and the PCA of each resample is computed from stacked covariance
+    matrices, with batches spread over a thread pool. Batches get their own
+    seeds spawned from seed, so results do not depend on n_jobs.
+
+    Args:
+        data: pd.DataFrame or Panel with the normalised data.
+        n_boot: int with the number of bootstrap resamples per sub-index.
+        seed: int with the random seed.
+        percentiles: tuple with the percentiles reported for each weight.
+        batch_size: int with the number of resamples decomposed together.
+        n_jobs: int with the number of threads.
+
+    Returns:
+        bands: pd.DataFrame indexed by (subindex, variable) with the full
+            sample weight and the requested percentiles
+    """
+    panel = data if isinstance(data, Panel) else Panel.from_frame(data)
+    sub_idxs = panel.subindices
+    seeds = np.random.SeedSequence(seed).spawn(len(sub_idxs))
+    bands = {}
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for idx, idx_seed in zip(sub_idxs, seeds):
+            # Selecting and pooling data
+            idx_data = panel.subindex(idx)
+            pooled_data = idx_data.pooled()
+            X = pooled_data[~np.isnan(pooled_data).any(axis=1)]
+            # Running the resamples in batches
+            sizes = [batch_size]*(n_boot//batch_size)
+            if n_boot % batch_size:
+                sizes.append(n_boot % batch_size)
+            batch_seeds = idx_seed.spawn(len(sizes))
+            draws = pool.map(lambda b: _bootstrap_batch(X, PC_N[idx], *b), zip(sizes, batch_seeds))
+            draws = np.concatenate(list(draws))
+            # Summarising
+            df = pd.DataFrame(np.percentile(draws, percentiles, axis=0).T,
+                              index=idx_data.variables, columns=[f'p{x:g}' for x in percentiles])
+            vr, w, _ = pca_analysis(X, PC_N[idx])
+            df.insert(0, 'weight', combine_weights(vr, w))
+            bands[idx] = df
+    bands = pd.concat(bands, names=['subindex', 'variable'])
+
+    return bands
     
 
-def calculate_sub(data: pd.DataFrame, weights: dict):
-    """Calculates sub-indices given data and weights"""
-    sub_idxs = data.columns.get_level_values('subindex').unique()
-    final_idxs = {}
-    for idx in sub_idxs:
+def aggregate(values: np.ndarray, w: np.ndarray, mask: np.ndarray = None,
+              missing: str = 'all', min_share: float = 0.5) -> np.ndarray:
+    """Weighted sum over the variables of a (dates, vars, countries) array.
+
+    Args:
+        values: np.ndarray with shape (dates, vars, countries).
+        w: np.ndarray with the weights, either (vars,) or a stack of weight
+            vectors with shape (draws, vars).
+        mask: np.ndarray with shape (vars, countries), False for the columns
+            a country lacks altogether.
+        missing: str with the missing data policy:
+            'all' - the sum is missing if any weighted variable is missing;
+                columns a country lacks count as zero.
+            'renormalise' - the weights are rescaled over the observed
+                variables.
+            'min_share' - as 'renormalise', but missing unless the observed
+                variables carry at least min_share of the total weight.
+        min_share: float with the minimum observed weight for 'min_share'.
+
+    Returns:
+        agg: np.ndarray with shape (dates, countries), or (draws, dates,
+            countries) for stacked weights
+    """
+    n_t, n_v, n_c = values.shape
+    if mask is None:
+        mask = np.ones((n_v, n_c), dtype=bool)
+    w2 = np.atleast_2d(w)
+    observed = ~np.isnan(values)
+    # Variables as rows so that all draws come from one matrix product
+    flat = lambda x: x.transpose(1, 0, 2).reshape(n_v, -1)
+    x0 = flat(np.where(observed, values, 0))
+    num = w2 @ x0
+    if missing == 'all':
+        # Float products so that the counts also go through BLAS
+        used = (w2>0).astype(float)
+        lacking = used @ flat(~observed & mask).astype(float)
+        present = np.tile(used @ mask.astype(float), n_t)
+        agg = np.where((lacking > 0) | (present == 0), np.nan, num)
+    elif missing in ('renormalise', 'min_share'):
+        w_obs = w2 @ flat(observed).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            agg = num / w_obs
+        if missing == 'min_share':
+            keep = w_obs >= min_share*w2.sum(axis=1, keepdims=True)
+        else:
+            keep = w_obs > 0
+        agg = np.where(keep, agg, np.nan)
+    else:
+        raise ValueError(f"Unknown missing data policy: {missing}")
+    agg = agg.reshape(-1, n_t, n_c)
+
+    return agg[0] if np.ndim(w) == 1 else agg
+
+
+@instrument.stage()
+def calculate_sub(data, weights: dict, missing: str = 'all', min_share: float = 0.5):
+    """Calculates sub-indices given data (df or Panel) and weights, with the
+    missing data policy of aggregate"""
+    panel = data if isinstance(data, Panel) else Panel.from_frame(data)
+    sub_idxs = panel.subindices
+    values = np.full((len(panel.dates), len(sub_idxs), len(panel.countries)), np.nan)
+    for i, idx in enumerate(sub_idxs):
         # Selecting data
-        int_data = data.xs(idx, axis=1, level='subindex')
+        int_data = panel.subindex(idx)
         w_all = weights[idx]
         w_idx = w_all[w_all>0]
-        idx_data = int_data.reindex(w_idx.index, axis=1, level='variable')
-        # Multiplying by weight
-        prod_data = idx_data.multiply(w_idx, level='variable')
-        #TODO: think if this is the way we want to treat missing values for individial variables
-        series = prod_data.fillna(np.inf).groupby(axis=1, level='country').sum().replace(np.inf, np.nan)
-        final_idxs[idx] = series
-    df = pd.concat(final_idxs, axis=1, names=['subindex'])
-    final_df = df.dropna(how='all').dropna(axis=1, how='all')
+        var_pos = int_data.variables.get_indexer(w_idx.index)
+        w_idx = w_idx[var_pos>=0]
+        var_pos = var_pos[var_pos>=0]
+        # Aggregating with weights
+        values[:, i] = aggregate(int_data.values[:, var_pos], w_idx.to_numpy(),
+                                 int_data.mask[var_pos], missing, min_share)
+    mask = ~np.isnan(values).all(axis=0)
+    sub_panel = Panel(values, panel.dates, sub_idxs, panel.countries, mask)
+    # Dropping dates without any observation
+    sub_panel = sub_panel.dropna_dates()
+    if isinstance(data, Panel):
+        return sub_panel
+    final_df = sub_panel.to_frame()
     
     return final_df
    
@@ -77,10 +224,11 @@ def calculate_sub(data: pd.DataFrame, weights: dict):
 if __name__ == '__main__':
     # Setting path and reading data
     os.chdir('/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data')
-    data = pd.read_csv('z_scores.csv', header = [0,1,2], index_col = [0], parse_dates=True)
+    data = storage.open_panel('z_scores')
     # Calculating weights
     weights = calculate_weights(data)
     # Calculating sub-indices
     sub_indices = calculate_sub(data, weights)
     # Exporting
-    sub_indices.to_csv('sub_indices.csv')
+    storage.write_panel(sub_indices, 'sub_indices')
+    sub_indices.to_frame().to_csv('sub_indices.csv')
@@ -8,6 +8,28 @@ Created on Tue Oct 12 15:17:55 2021
 import numpy as np
 import pandas as pd
 
+import support_functions as sf
+
+# Default location of the control variables' raw files
+CONTROL_PATH = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/control variables/'
+
+# WDI controls: (series name, output name, denominator series, scale)
+WB_SPEC = [
+    # Inflation - Annual growth of rate of country level CPI inflation
+    ('Inflation, consumer prices (annual %)', 'infla', None, 1),
+    # Goverment Consumption - annual government consumption to GDP ratio (5y rolling std below)
+    ('General government final consumption expenditure (% of GDP)', 'gov_spending', None, 1),
+    # Current Account - Annual current account balance to GDP ratio
+    ('Current account balance (% of GDP)', 'bca', None, 1),
+    # Trade Openess - Real exports plus real imports divided by real GDP
+    ('Trade (% of GDP)', 'trade', None, 1),
+    # Domestic Private Credit - The ratio of domestic credit provided by the banking sector to GDP
+    ('Domestic credit to private sector (% of GDP)', 'credit', None, 1),
+    # Stock Market Capitalization - The ratio of stock market capitalization to GDP
+    ('Market capitalization of listed domestic companies (% of GDP)', 'market_cap', None, 1),
+]
+
+
 def wb_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from World Bank file
 
@@ -18,36 +40,12 @@ def wb_import(files_path: str) -> pd.DataFrame:
         df: pd.DataFrame with the final output
     """
     # Importing data
-    wb_df = pd.read_excel(files_path+'WB.xlsx', header = [0], index_col = [0, 1, 2, 3])
-    wb_df.columns = [x[:4] for x in wb_df.columns]
-    wb_df = wb_df.droplevel('Series Code')
-    wb_df = wb_df.droplevel('Country Name')
-    wb_df = wb_df.T.replace(['..', 0], np.nan)
+    wb_df = sf.wb_panel(files_path)
     # Transforming variables
-    wb_df.index = pd.to_datetime(wb_df.index, format='%Y')
-    wb_df = wb_df.fillna(method='ffill')
-    wb = {}
-    # Inflation - Annual growth of rate of country level CPI inflation
-    col = 'Inflation, consumer prices (annual %)'
-    wb['infla'] = wb_df.xs(col, axis=1, level=1)
-    # Goverment Consumption - 5y rolling standard deviation of annual government consumption to GDP ratio
-    col = 'General government final consumption expenditure (% of GDP)'
-    wb['gov_spending'] = wb_df.xs(col, axis=1, level=1).rolling(5).std()
-    # Current Account - Annual current account balance to GDP ratio
-    col = 'Current account balance (% of GDP)'
-    wb['bca'] = wb_df.xs(col, axis=1, level=1)
-    # Trade Openess - Real exports plus real imports divided by real GDP
-    col = 'Trade (% of GDP)'
-    wb['trade'] = wb_df.xs(col, axis=1, level=1)
-    # Domestic Private Credit - The ratio of domestic credit provided by the banking sector to GDP
-    col = 'Domestic credit to private sector (% of GDP)'
-    wb['credit'] = wb_df.xs(col, axis=1, level=1)
-    # Stock Market Capitalization
-    col = 'Market capitalization of listed domestic companies (% of GDP)'
-    wb['market_cap'] = wb_df.xs(col, axis=1, level=1)
-    # Concatenating - The ratio of stock market capitalization to GDP
-    df = pd.concat(wb, axis=1, names=["variable"])
-    df.columns.set_names('country', level='Country Code', inplace=True)
+    df = sf.wdi_extract(wb_df, WB_SPEC, ffill=True)
+    # Goverment Consumption - 5y rolling standard deviation
+    gov = df[['gov_spending']].rolling(5).std()
+    df[gov.columns] = gov
     
     return df 
 
@@ -108,8 +106,8 @@ def import_lpi(files_path: str) -> pd.DataFrame:
     return df
 
 
-def import_control(t0, tT):
-    control_path = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/control variables/'
+def import_control(t0, tT, control_path: str = CONTROL_PATH):
+    """Imports all control variables between t0 and tT"""
     df = pd.concat([wb_import(control_path), import_tot(control_path), 
                     import_exp_con(control_path), import_lpi(control_path)], axis=1)
     
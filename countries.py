@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 17:05:21 2026
+
+@author: talespadilha
+"""
+
+import os
+import pandas as pd
+
+# Csv with (scheme, code, iso3) rows mapping source specific codes to the WDI
+# ISO3 codes used as canonical. It ships the 'unesco' (ISO2) and 'olympics'
+# (IOC) schemes; the other relabelled schemes (icrg, unctad, lowy, wef,
+# gdelt) are taken to use ISO3 already and are left as they are until rows
+# are added for them
+ALIASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'country_aliases.csv')
+# Alias tables, loaded on first use
+_ALIASES = None
+
+
+def _aliases() -> dict:
+    """Returns {scheme: {code: canonical code}}, loading ALIASES_FILE once"""
+    global _ALIASES
+    if _ALIASES is None:
+        _ALIASES = {}
+        if os.path.exists(ALIASES_FILE):
+            # 'NA' is Namibia, not a missing value
+            table = pd.read_csv(ALIASES_FILE, dtype=str, keep_default_na=False)
+            for scheme, rows in table.groupby('scheme'):
+                _ALIASES[scheme] = dict(zip(rows['code'], rows['iso3']))
+
+    return _ALIASES
+
+
+def register_aliases(scheme: str, mapping: dict):
+    """Adds {source code: canonical code} aliases for a scheme"""
+    _aliases().setdefault(scheme, {}).update(mapping)
+
+
+def canonical(codes, scheme: str = None) -> pd.Index:
+    """Maps a scheme's codes to canonical codes (unknown codes are kept)"""
+    codes = pd.Index(codes)
+    mapping = _aliases().get(scheme)
+    if not mapping:
+        return codes
+
+    return pd.Index([mapping.get(c, c) for c in codes], name=codes.name)
+
+
+def relabel(df: pd.DataFrame, scheme: str, level: str = 'country') -> pd.DataFrame:
+    """Replaces a scheme's codes in df's (level of) columns by canonical codes"""
+    mapping = _aliases().get(scheme)
+    if not mapping:
+        return df
+
+    return df.rename(columns=mapping, level=level if df.columns.nlevels > 1 else None)
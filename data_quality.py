@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:30:46 2026
+
+@author: talespadilha
+"""
+
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+import instrument
+from panel import Panel
+
+# Robust z score above which a value is an outlier in its year's cross
+# section, and a year-on-year change is a jump among the variable's changes
+OUTLIER_Z = 5
+JUMP_Z = 8
+# Statistics compared by diff, with the relative change that is reported
+DIFF_TOL = {'first': 0, 'last': 0, 'countries': 0, 'obs': 0.02, 'mean': 0.05,
+            'std': 0.05, 'p50': 0.05}
+
+
+def _robust_z(x: np.ndarray, axis) -> np.ndarray:
+    """Distance to the median in units of 1.4826*MAD along axis; the std is
+    used where the MAD is zero (e.g. ratings that rarely change)"""
+    med = np.nanmedian(x, axis=axis, keepdims=True)
+    scale = 1.4826*np.nanmedian(np.abs(x-med), axis=axis, keepdims=True)
+    scale = np.where(scale > 0, scale, np.nanstd(x, axis=axis, keepdims=True))
+
+    return np.abs(x-med)/np.where(scale > 0, scale, np.nan)
+
+
+@instrument.stage()
+def profile(df, outlier_z: float = OUTLIER_Z, jump_z: float = JUMP_Z) -> dict:
+    """Profiles every variable of the merged (subindex, variable, country) data.
+
+    The data is laid out as a Panel once and every statistic comes from
+    reductions over its (dates, variables, countries) array. Outliers are
+    values whose robust z score in their year's cross section exceeds
+    outlier_z; jumps are year-on-year changes of a country whose robust z
+    score among all the variable's changes exceeds jump_z.
+
+    Args:
+        df: pd.DataFrame (or Panel) with the merged data from merge_sources.
+        outlier_z: float with the outlier threshold.
+        jump_z: float with the jump threshold.
+
+    Returns:
+        profile: dict with the 'stats' (by (subindex, variable): first and
+            last dates, countries, observations, moments, quantiles and flag
+            counts), the 'coverage' (share of each variable's countries
+            observed by date, with the sub-index averages) and the 'flags'
+            (one row per flagged value)
+    """
+    panel = df if isinstance(df, Panel) else Panel.from_frame(df)
+    cube = panel.values
+    n_t, n_v, n_c = cube.shape
+    obs = ~np.isnan(cube)
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        # Coverage
+        any_obs = obs.any(axis=2)
+        dated = any_obs.any(axis=0)
+        first = np.where(dated, any_obs.argmax(axis=0), 0)
+        last = np.where(dated, n_t-1-any_obs[::-1].argmax(axis=0), 0)
+        countries = panel.mask.sum(axis=1)
+        coverage = obs.sum(axis=2)/countries
+        # Moments and quantiles of all observations of each variable
+        pooled = cube.transpose(1, 0, 2).reshape(n_v, -1)
+        quantiles = np.nanpercentile(pooled, [0, 5, 50, 95, 100], axis=1)
+        # Outliers in each year's cross section and jumps within countries
+        outliers = _robust_z(cube, axis=2) > outlier_z
+        changes = np.diff(cube, axis=0)
+        pooled_changes = changes.transpose(1, 0, 2).reshape(n_v, -1)
+        jump_score = _robust_z(pooled_changes, axis=1).reshape(n_v, n_t-1, n_c).transpose(1, 0, 2)
+        jumps = np.zeros(cube.shape, dtype=bool)
+        jumps[1:] = jump_score > jump_z
+        stats = pd.DataFrame({
+            'first': np.where(dated, panel.dates[first], pd.NaT),
+            'last': np.where(dated, panel.dates[last], pd.NaT),
+            'countries': countries,
+            'obs': obs.sum(axis=(0, 2)),
+            'coverage': obs.sum(axis=(0, 2))/(countries*(last-first+1)),
+            'mean': np.nanmean(pooled, axis=1),
+            'std': np.nanstd(pooled, axis=1, ddof=1),
+            'min': quantiles[0], 'p5': quantiles[1], 'p50': quantiles[2],
+            'p95': quantiles[3], 'max': quantiles[4],
+            'outliers': outliers.sum(axis=(0, 2)),
+            'jumps': jumps.sum(axis=(0, 2)),
+        }, index=panel.variables)
+    stats['first'] = pd.to_datetime(stats['first'])
+    stats['last'] = pd.to_datetime(stats['last'])
+    coverage = pd.DataFrame(coverage, index=panel.dates, columns=panel.variables)
+    if 'subindex' in panel.variables.names and panel.variables.nlevels > 1:
+        by_sub = coverage.T.groupby(level='subindex', sort=False).mean().T
+        by_sub.columns = pd.MultiIndex.from_arrays([by_sub.columns, ['all']*len(by_sub.columns)],
+                                                   names=panel.variables.names)
+        coverage = pd.concat([coverage, by_sub], axis=1)
+    # Flagged values
+    t_pos, v_pos, c_pos = np.nonzero(outliers | jumps)
+    prev = np.where(t_pos > 0, cube[np.maximum(t_pos-1, 0), v_pos, c_pos], np.nan)
+    flags = pd.DataFrame({'value': cube[t_pos, v_pos, c_pos], 'previous': prev,
+                          'outlier': outliers[t_pos, v_pos, c_pos], 'jump': jumps[t_pos, v_pos, c_pos]})
+    labels = panel.variables[v_pos]
+    arrays = [panel.dates[t_pos]]
+    arrays += [labels.get_level_values(i) for i in range(labels.nlevels)]
+    flags.index = pd.MultiIndex.from_arrays(arrays+[panel.countries[c_pos]],
+                                            names=['date']+list(panel.variables.names)+['country'])
+
+    return {'stats': stats, 'coverage': coverage, 'flags': flags}
+
+
+def diff(current: pd.DataFrame, previous: pd.DataFrame, tol: dict = DIFF_TOL) -> pd.DataFrame:
+    """Compares two profile stats and lists the notable changes.
+
+    Args:
+        current: pd.DataFrame with the stats of this run.
+        previous: pd.DataFrame with the stats of a previous run.
+        tol: dict with the statistics compared and the relative change
+            reported for each (0 reports any change).
+
+    Returns:
+        changes: pd.DataFrame indexed by (variable labels..., stat) with the
+            previous and current values; variables added or dropped have
+            stat 'added' or 'dropped'
+    """
+    rows = {}
+    for var in current.index.difference(previous.index):
+        rows[(*np.atleast_1d(var), 'added')] = (np.nan, np.nan)
+    for var in previous.index.difference(current.index):
+        rows[(*np.atleast_1d(var), 'dropped')] = (np.nan, np.nan)
+    common = current.index.intersection(previous.index)
+    for stat, limit in tol.items():
+        new, old = current.loc[common, stat], previous.loc[common, stat]
+        if stat in ('first', 'last'):
+            changed = new.ne(old) & ~(new.isna() & old.isna())
+        else:
+            with np.errstate(all='ignore'):
+                rel = (new-old).abs()/old.abs()
+            changed = (rel > limit) | (new.isna() != old.isna()) | ((old == 0) & (new != 0))
+        for var in common[changed.to_numpy()]:
+            rows[(*np.atleast_1d(var), stat)] = (old[var], new[var])
+    names = list(current.index.names)+['stat']
+    index = pd.MultiIndex.from_tuples(list(rows), names=names) if rows \
+        else pd.MultiIndex.from_tuples([], names=names)
+
+    return pd.DataFrame(list(rows.values()), index=index, columns=['previous', 'current'])
+
+
+def read_stats(file: str) -> pd.DataFrame:
+    """Reads stats written by write_profile"""
+    header = pd.read_csv(file, nrows=0)
+    n_levels = list(header.columns).index('first')
+    stats = pd.read_csv(file, index_col=list(range(n_levels)), parse_dates=['first', 'last'])
+
+    return stats
+
+
+def write_profile(prof: dict, out_path: str) -> pd.DataFrame:
+    """Writes a profile to quality_*.csv files in out_path, diffing its stats
+    against the previous ones first
+
+    Returns:
+        changes: pd.DataFrame from diff (None without previous stats)
+    """
+    file = out_path+'quality_stats.csv'
+    changes = diff(prof['stats'], read_stats(file)) if os.path.exists(file) else None
+    if changes is not None:
+        changes.to_csv(out_path+'quality_diff.csv')
+    prof['stats'].to_csv(file)
+    prof['coverage'].to_csv(out_path+'quality_coverage.csv')
+    prof['flags'].to_csv(out_path+'quality_flags.csv')
+
+    return changes
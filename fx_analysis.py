@@ -10,15 +10,18 @@ import numpy as np
 import pandas as pd
 import os
 
+import instrument
 
-def import_imf_dic():
-    """Imports dictionary for IMF country codes"""
-    data = pd.read_csv('imf_country_map.csv', header = [0], index_col = [0]).to_dict()
+
+def import_imf_dic(files_path: str = ''):
+    """Imports dictionary for IMF country codes from files_path"""
+    data = pd.read_csv(files_path+'imf_country_map.csv', header = [0], index_col = [0]).to_dict()
     imf_dict = data['Code']
     
     return imf_dict
 
 
+@instrument.stage()
 def imf_import(data_path: str, file_name: str):
     """Import data from IMF's (transformed) XLSX Excel file.
 
@@ -31,11 +34,13 @@ def imf_import(data_path: str, file_name: str):
     """
     #Importing the data:
     data0 = pd.read_excel(data_path+file_name, header = [0,1], index_col = [0,1])
+    instrument.parsed(data0)
     data = data0.droplevel(1).droplevel(0, axis=1).T    
     data.index = pd.to_datetime(data.index, format='%b %Y')
 
     return data
 
+@instrument.stage()
 def reer_vol(indices: pd.DataFrame):
     """Calculated annualized volatility using monthly realized vol"""
     vol = np.sqrt((np.log(indices).diff()**2))*100
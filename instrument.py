@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 09:12:34 2026
+
+@author: talespadilha
+"""
+
+import os
+import json
+import time
+import math
+import functools
+import tracemalloc
+import pandas as pd
+
+# Instrumentation is off unless this variable is set (enable sets it, so
+# worker processes started afterwards record their stages too)
+ENV_FLAG = 'SOFT_POWER_INSTRUMENT'
+ENV_PROFILE = 'SOFT_POWER_PROFILE_DIR'
+# Stage records of the current process
+RECORDS = []
+# Stages running in the current process (innermost last), with the peak
+# memory their nested stages reached and the raw tables they parsed
+_OPEN = []
+
+
+def enable(profile_dir: str = None):
+    """Turns instrumentation on, optionally dumping a cProfile per stage"""
+    os.environ[ENV_FLAG] = '1'
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+        os.environ[ENV_PROFILE] = profile_dir
+
+
+def disable():
+    """Turns instrumentation (and profiling) off"""
+    os.environ.pop(ENV_FLAG, None)
+    os.environ.pop(ENV_PROFILE, None)
+
+
+def enabled() -> bool:
+    return os.environ.get(ENV_FLAG) == '1'
+
+
+def _shape(x):
+    """Returns [rows, columns] of a df, Series, Panel or array (None otherwise);
+    trailing array dimensions are counted as columns"""
+    if isinstance(x, pd.DataFrame):
+        return list(x.shape)
+    if isinstance(x, pd.Series):
+        return [len(x), 1]
+    shape = getattr(x, 'shape', None)
+    if isinstance(shape, tuple) and len(shape) > 0:
+        return [int(shape[0]), int(math.prod(shape[1:]))]
+    return None
+
+
+def parsed(table):
+    """Records the shape of a raw table (df or (rows, columns)) read by the
+    running stages, for stages whose input is a file path"""
+    if _OPEN:
+        shape = list(table) if isinstance(table, tuple) else _shape(table)
+        for entry in _OPEN:
+            entry['parsed'].append(shape)
+
+
+def _enter() -> dict:
+    """Opens a stage, starting its traced memory peak"""
+    entry = {'started': not tracemalloc.is_tracing(), 'parsed': []}
+    if entry['started']:
+        tracemalloc.start()
+    current, peak = tracemalloc.get_traced_memory()
+    # The enclosing stage keeps the peak it reached so far
+    if _OPEN:
+        _OPEN[-1]['peak'] = max(_OPEN[-1]['peak'], peak)
+    tracemalloc.reset_peak()
+    entry['base'] = entry['peak'] = current
+    _OPEN.append(entry)
+
+    return entry
+
+
+def _exit(entry: dict) -> float:
+    """Closes a stage and returns its peak memory above its start in MB"""
+    peak = max(tracemalloc.get_traced_memory()[1], entry['peak'])
+    _OPEN.remove(entry)
+    if _OPEN:
+        _OPEN[-1]['peak'] = max(_OPEN[-1]['peak'], peak)
+    if entry['started']:
+        tracemalloc.stop()
+
+    return (peak-entry['base'])/1e6
+
+
+def stage(name: str = None):
+    """Decorator recording a stage's timings, shapes and memory when enabled.
+
+    Each call appends a record with the wall and CPU time, the shape of the
+    first argument (or, for importers taking a path, the total rows and
+    columns of the raw tables they parsed, see parsed), the shape of the
+    output and the stage's peak memory to RECORDS. The peak is the highest
+    memory traced by tracemalloc during the call (nested stages included)
+    above what was allocated when it started, which slows the traced code
+    down. If a profile directory was given to enable, the call also runs
+    under cProfile with the stats dumped to
+    <profile_dir>/<stage>.<pid>.prof. With instrumentation off the function
+    is called directly.
+
+    Args:
+        name: str with the stage name; defaults to module.function.
+    """
+    def decorator(func):
+        label = name or f'{func.__module__}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            profile_dir = os.environ.get(ENV_PROFILE)
+            if profile_dir:
+                import cProfile
+                profiler = cProfile.Profile()
+            start = time.strftime('%Y-%m-%dT%H:%M:%S')
+            entry = _enter()
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                if profile_dir:
+                    out = profiler.runcall(func, *args, **kwargs)
+                    profiler.dump_stats(os.path.join(profile_dir, f'{label}.{os.getpid()}.prof'))
+                else:
+                    out = func(*args, **kwargs)
+            finally:
+                wall, cpu = time.perf_counter()-wall, time.process_time()-cpu
+                peak = _exit(entry)
+            shape_in = _shape(args[0]) if args else None
+            if shape_in is None and entry['parsed']:
+                shape_in = [sum(x[0] for x in entry['parsed']), sum(x[1] for x in entry['parsed'])]
+            RECORDS.append({'stage': label, 'pid': os.getpid(), 'start': start,
+                            'wall_s': wall, 'cpu_s': cpu,
+                            'shape_in': shape_in, 'parsed': entry['parsed'],
+                            'shape_out': _shape(out), 'peak_mb': peak})
+            return out
+
+        return wrapper
+
+    return decorator
+
+
+def drain() -> list:
+    """Returns and clears the records of the current process (used to send
+    worker records back to the parent)"""
+    records = list(RECORDS)
+    RECORDS.clear()
+
+    return records
+
+
+def collect(records: list):
+    """Adds records gathered in another process"""
+    RECORDS.extend(records)
+
+
+def report(file: str = None) -> pd.DataFrame:
+    """Returns the run's stage records, also writing them to a json file"""
+    if file is not None:
+        with open(file, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': RECORDS}, f, indent=2)
+
+    return pd.DataFrame(RECORDS, columns=['stage', 'pid', 'start', 'wall_s', 'cpu_s', 'shape_in',
+                                          'parsed', 'shape_out', 'peak_mb'])
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 13 09:12:27 2026
+
+@author: talespadilha
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _as_slice(loc):
+    """Turns an int or a contiguous boolean mask from get_loc into a slice, so
+    that indexing with it returns a view"""
+    if isinstance(loc, (int, np.integer)):
+        return slice(loc, loc+1)
+    if isinstance(loc, np.ndarray):
+        pos = np.flatnonzero(loc) if loc.dtype == bool else loc
+        if len(pos) and pos[-1]-pos[0]+1 == len(pos):
+            return slice(pos[0], pos[-1]+1)
+        return pos
+
+    return loc
+
+
+def ffill_values(values: np.ndarray, limit=None, back_limit: int = None) -> tuple:
+    """Forward fills nas along the first axis of an array in one pass.
+
+    Args:
+        values: np.ndarray with time on the first axis.
+        limit: maximum age (in periods) of a carried value, either a scalar
+            or an array broadcasting against values.shape[1:] (e.g. one limit
+            per variable); None carries values forever.
+        back_limit: int with the number of periods an observation is also
+            carried backwards into gaps the forward fill left (as a
+            bfill(limit=back_limit) after the ffill).
+
+    Returns:
+        filled: np.ndarray shaped as values.
+        age: np.ndarray with the periods since the observation used (negative
+            when carried backwards, 0 for observed values and nan where
+            nothing was filled)
+    """
+    t = np.arange(len(values), dtype=float).reshape((-1,)+(1,)*(values.ndim-1))
+    obs_t = np.where(np.isnan(values), np.nan, t)
+    # Position of the last observation so far (fmax skips the nas)
+    age = t - np.fmax.accumulate(obs_t, axis=0)
+    if limit is not None:
+        age[age > limit] = np.nan
+    if back_limit is not None:
+        back = t - np.fmin.accumulate(obs_t[::-1], axis=0)[::-1]
+        fill_back = np.isnan(age) & (back >= -back_limit)
+        age[fill_back] = back[fill_back]
+    found = ~np.isnan(age)
+    src = np.where(found, t-np.where(found, age, 0), 0).astype(np.intp)
+    filled = np.take_along_axis(values, src, axis=0)
+    filled[~found] = np.nan
+
+    return filled, age
+
+
+def ffill_frame(df: pd.DataFrame, limits=None, back_limit: int = None) -> tuple:
+    """Forward fills a df with ffill_values.
+
+    Args:
+        df: pd.DataFrame with dates as index.
+        limits: scalar maximum age, or dict with the maximum age of each
+            value of the 'variable' column level (others are not limited).
+        back_limit: int with the number of periods carried backwards.
+
+    Returns:
+        filled: pd.DataFrame shaped as df.
+        age: pd.DataFrame with the age of every filled value
+    """
+    if isinstance(limits, dict):
+        limits = np.array([limits.get(v, np.inf) for v in df.columns.get_level_values('variable')])
+    filled, age = ffill_values(df.to_numpy(dtype=float), limits, back_limit)
+    filled = pd.DataFrame(filled, index=df.index, columns=df.columns)
+    age = pd.DataFrame(age, index=df.index, columns=df.columns)
+
+    return filled, age
+
+
+class Panel:
+    """Dense (time, variable, country) panel of float64 values.
+
+    Values are held in one contiguous array together with the labels of each
+    axis. Variables are grouped by subindex, so selecting a subindex, a single
+    variable or a single country returns a view on the same memory. The mask
+    records which (variable, country) columns exist in the source frame, as
+    sources do not cover the same countries and the padding should not be
+    confused with missing observations.
+
+    Attributes:
+        values: np.ndarray with shape (dates, variables, countries).
+        dates: pd.Index with the time labels.
+        variables: pd.Index (or pd.MultiIndex with a 'subindex' level) with
+            the variable labels.
+        countries: pd.Index with the country codes.
+        mask: np.ndarray with shape (variables, countries), True where the
+            column exists.
+    """
+
+    def __init__(self, values: np.ndarray, dates: pd.Index, variables: pd.Index,
+                 countries: pd.Index, mask: np.ndarray = None):
+        self.values = values
+        self.dates = dates
+        self.variables = variables
+        self.countries = countries
+        if mask is None:
+            mask = np.ones(values.shape[1:], dtype=bool)
+        self.mask = mask
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """Builds a Panel from a df whose last column level is 'country'"""
+        var_labels = df.columns.droplevel('country')
+        # Keeping variables of the same subindex next to each other
+        if 'subindex' in var_labels.names and var_labels.nlevels > 1:
+            order = pd.factorize(var_labels.get_level_values('subindex'))[0]
+            first = pd.factorize(var_labels)[0]
+            variables = var_labels[np.lexsort((first, order))].unique()
+        else:
+            variables = var_labels.unique()
+        countries = df.columns.get_level_values('country').unique().sort_values()
+        var_pos = variables.get_indexer(var_labels)
+        cc_pos = countries.get_indexer(df.columns.get_level_values('country'))
+        values = np.full((len(df), len(variables), len(countries)), np.nan)
+        values[:, var_pos, cc_pos] = df.to_numpy(dtype=float)
+        mask = np.zeros((len(variables), len(countries)), dtype=bool)
+        mask[var_pos, cc_pos] = True
+
+        return cls(values, df.index, variables, countries, mask)
+
+    def to_frame(self, columns: pd.MultiIndex = None) -> pd.DataFrame:
+        """Converts the Panel to a df with (variable levels..., country) columns.
+
+        Args:
+            columns: pd.MultiIndex with the columns to return; by default all
+                columns present in the mask.
+
+        Returns:
+            df: pd.DataFrame with dates as index
+        """
+        if columns is None:
+            var_pos, cc_pos = np.nonzero(self.mask)
+            var_labels = self.variables[var_pos]
+            if isinstance(var_labels, pd.MultiIndex):
+                arrays = [var_labels.get_level_values(i) for i in range(var_labels.nlevels)]
+            else:
+                arrays = [var_labels]
+            arrays.append(self.countries[cc_pos])
+            names = list(self.variables.names)+['country']
+            columns = pd.MultiIndex.from_arrays(arrays, names=names)
+        else:
+            var_pos = self.variables.get_indexer(columns.droplevel('country'))
+            cc_pos = self.countries.get_indexer(columns.get_level_values('country'))
+        df = pd.DataFrame(self.values[:, var_pos, cc_pos], index=self.dates, columns=columns)
+
+        return df
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    def _take(self, var_loc=slice(None), cc_loc=slice(None)):
+        """Returns a Panel viewing the selected variables and countries"""
+        var_loc = _as_slice(var_loc)
+        cc_loc = _as_slice(cc_loc)
+        values = self.values[:, var_loc, cc_loc]
+        mask = self.mask[var_loc, cc_loc]
+
+        return Panel(values, self.dates, self.variables[var_loc], self.countries[cc_loc], mask)
+
+    def subindex(self, name: str):
+        """Selects the variables of one subindex, dropping the subindex level"""
+        loc = self.variables.get_loc(name)
+        panel = self._take(var_loc=loc)
+        panel.variables = panel.variables.droplevel('subindex')
+
+        return panel
+
+    def variable(self, name):
+        """Selects a single variable (a (subindex, variable) tuple for
+        three-level panels)"""
+        return self._take(var_loc=self.variables.get_loc(name))
+
+    def country(self, code: str):
+        """Selects a single country"""
+        return self._take(cc_loc=self.countries.get_loc(code))
+
+    @property
+    def subindices(self) -> pd.Index:
+        return self.variables.get_level_values('subindex').unique()
+
+    def pooled(self) -> np.ndarray:
+        """Returns values as a (dates*countries, variables) array"""
+        return self.values.transpose(0, 2, 1).reshape(-1, self.values.shape[1])
+
+    def dropna_dates(self):
+        """Returns a Panel without the dates where every value is missing"""
+        keep = ~np.isnan(self.values).all(axis=(1, 2))
+        if keep.all():
+            return self
+
+        return Panel(self.values[keep], self.dates[keep], self.variables, self.countries, self.mask)
+
+    def ffill(self, limits=None, back_limit: int = None) -> tuple:
+        """Forward fills the Panel with ffill_values.
+
+        Args:
+            limits: scalar maximum age, or dict with the maximum age of
+                each variable (keyed by its last label level).
+            back_limit: int with the number of periods carried backwards.
+
+        Returns:
+            filled: Panel with the filled values.
+            age: np.ndarray (dates, variables, countries) with the age of
+                every filled value
+        """
+        if isinstance(limits, dict):
+            names = self.variables.get_level_values(-1)
+            limits = np.array([limits.get(v, np.inf) for v in names])[:, None]
+        filled, age = ffill_values(self.values, limits, back_limit)
+
+        return self.copy(filled), age
+
+    def copy(self, values: np.ndarray = None):
+        """Returns a Panel with the same labels and new (or copied) values"""
+        if values is None:
+            values = self.values.copy()
+
+        return Panel(values, self.dates, self.variables, self.countries, self.mask.copy())
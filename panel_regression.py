@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 09:27:15 2026
+
+@author: talespadilha
+"""
+
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+
+def within_transform(df: pd.DataFrame, entity_level=1, time_level=0,
+                     tol: float = 1e-10, max_iter: int = 1000) -> pd.DataFrame:
+    """Removes entity and time effects from every column of a stacked panel.
+
+    Entity and time means are subtracted alternately until the largest
+    remaining time mean is below tol, which gives the exact two-way within
+    transformation on unbalanced panels as well (a single pass is enough
+    for balanced ones).
+
+    Args:
+        df: pd.DataFrame with a (time, entity) MultiIndex and no nas.
+        entity_level: level (position or name) with the entities.
+        time_level: level (position or name) with the dates.
+        tol: float with the convergence tolerance.
+        max_iter: int with the maximum number of iterations.
+
+    Returns:
+        demeaned: pd.DataFrame with the same shape as df
+    """
+    entity = df.index.get_level_values(entity_level)
+    time = df.index.get_level_values(time_level)
+    demeaned = df - df.mean()
+    for _ in range(max_iter):
+        demeaned = demeaned - demeaned.groupby(entity).transform('mean')
+        time_means = demeaned.groupby(time).transform('mean')
+        demeaned = demeaned - time_means
+        if np.abs(time_means.to_numpy()).max() < tol:
+            break
+
+    return demeaned
+
+
+def add_lags(df: pd.DataFrame, cols: list, lags: list, entity_level=1) -> pd.DataFrame:
+    """Adds lagged copies (named col_l{lag}) of cols within each entity"""
+    grouped = df[cols].groupby(level=entity_level)
+    lagged = {f'{col}_l{lag}': grouped[col].shift(lag) for col in cols for lag in lags}
+    df = pd.concat([df, pd.DataFrame(lagged, index=df.index)], axis=1)
+
+    return df
+
+
+def _cluster_crossproducts(Z: np.ndarray, clusters: np.ndarray) -> np.ndarray:
+    """Returns Z'Z within each cluster as a (clusters, m, m) array"""
+    order = np.argsort(clusters, kind='stable')
+    Z, clusters = Z[order], clusters[order]
+    starts = np.flatnonzero(np.r_[True, clusters[1:] != clusters[:-1]])
+    outer = Z[:, :, None]*Z[:, None, :]
+
+    return np.add.reduceat(outer, starts, axis=0)
+
+
+def _solve_spec(C: np.ndarray, Cg: np.ndarray, ix: np.ndarray, n: int) -> tuple:
+    """OLS with cluster robust standard errors from the cross products.
+
+    Column 0 of the cross products is the dependent variable and ix are the
+    positions of the regressors.
+    """
+    XX = C[np.ix_(ix, ix)]
+    Xy = C[ix, 0]
+    b = np.linalg.solve(XX, Xy)
+    rss = C[0, 0] - 2*b @ Xy + b @ XX @ b
+    # Cluster scores X_g'e_g = X_g'y_g - X_g'X_g b
+    scores = Cg[:, ix, 0] - Cg[:, ix][:, :, ix] @ b
+    bread = np.linalg.inv(XX)
+    G, k = len(Cg), len(ix)
+    correction = G/(G-1)*(n-1)/(n-k)
+    cov = correction*bread @ (scores.T @ scores) @ bread
+    se = np.sqrt(np.diag(cov))
+    r2 = 1 - rss/C[0, 0]
+
+    return b, se, r2
+
+
+def spec_search(data: pd.DataFrame, dep: str, regressors: list, specs: list = None,
+                max_size: int = None, groups: dict = None, entity_level=1,
+                time_level=0, n_jobs: int = None) -> pd.DataFrame:
+    """Fits many two-way fixed effects specifications on a stacked panel.
+
+    For each country group the sample is restricted to rows where the
+    dependent variable and every candidate regressor are observed, so all
+    specifications share one sample. The within transformation and the
+    cross products (overall and by entity) are then computed once, and each
+    specification is solved from the relevant sub-blocks, with standard
+    errors clustered by entity (with a G/(G-1)*(N-1)/(N-k) small sample
+    correction). Lagged regressors should be added with add_lags first.
+
+    Args:
+        data: pd.DataFrame with a (time, entity) MultiIndex.
+        dep: str with the dependent variable.
+        regressors: list with the candidate regressors.
+        specs: list of tuples of regressors; defaults to every subset of
+            regressors with up to max_size elements.
+        max_size: int with the largest subset size for the default specs.
+        groups: dict with group names and lists of entities; defaults to
+            all entities.
+        entity_level: level (position or name) with the entities.
+        time_level: level (position or name) with the dates.
+        n_jobs: int with the number of threads solving specifications.
+
+    Returns:
+        results: pd.DataFrame indexed by (group, spec, variable) with coef,
+            std_err, t_stat, nobs and r2_within
+    """
+    if specs is None:
+        max_size = len(regressors) if max_size is None else max_size
+        specs = [c for k in range(1, max_size+1) for c in itertools.combinations(regressors, k)]
+    if groups is None:
+        groups = {'all': None}
+    cols = [dep]+list(regressors)
+    pos = {col: i for i, col in enumerate(cols)}
+    results = {}
+    for group, entities in groups.items():
+        # Common sample for the group
+        sample = data[cols].dropna()
+        if entities is not None:
+            sample = sample[sample.index.get_level_values(entity_level).isin(entities)]
+        demeaned = within_transform(sample, entity_level, time_level)
+        Z = demeaned.to_numpy()
+        clusters = pd.factorize(sample.index.get_level_values(entity_level))[0]
+        Cg = _cluster_crossproducts(Z, clusters)
+        C = Cg.sum(axis=0)
+        n = len(Z)
+
+        def solve(spec):
+            b, se, r2 = _solve_spec(C, Cg, np.array([pos[x] for x in spec]), n)
+            return pd.DataFrame({'coef': b, 'std_err': se, 't_stat': b/se,
+                                 'nobs': n, 'r2_within': r2}, index=pd.Index(spec, name='variable'))
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            fits = pool.map(solve, specs)
+        for spec, fit in zip(specs, fits):
+            results[(group, ' + '.join(spec))] = fit
+    results = pd.concat(results, names=['group', 'spec'])
+
+    return results
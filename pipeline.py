@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:36:08 2026
+
+@author: talespadilha
+"""
+
+import os
+import json
+import argparse
+import pandas as pd
+
+import instrument
+from panel import Panel
+
+# The stage modules are imported by the stages that use them, so short runs
+# (e.g. recomputing the index) do not load the importers, sklearn or Excel
+# readers
+
+DATA_PATH = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/'
+# Stages in the order they run
+STAGES = ('import', 'quality', 'normalise', 'weights', 'sub_indices', 'index', 'fx')
+# Outputs with a country column level, filtered by years and countries in
+# the state returned by run
+FILTERED = ('raw', 'data', 'data_age', 'z_scores', 'maxmin', 'z_panel', 'sub_indices',
+            'sub_panel', 'index', 'reer', 'reer_vol')
+DEFAULTS = {
+    'raw_path': DATA_PATH+'Raw Data/',  # raw source files
+    'out_path': DATA_PATH,              # outputs (and inputs of skipped stages)
+    'stages': list(STAGES),
+    'years': None,                      # [first, last] year returned
+    'countries': None,                  # list of country codes returned
+    'max_workers': None,                # importer processes
+    'gdelt_chunksize': None,            # rows per chunk to stream GDELT files
+    'max_age': None,                    # years each variable is carried forward (td.MAX_AGE)
+    'missing': 'all',                   # sub-index missing data policy
+    'fx_file': 'reer_imf.xlsx',         # IMF REER workbook in raw_path
+    'imf_map_path': None,               # imf_country_map.csv folder (out_path)
+    'write': True,                      # write the stage outputs to out_path
+    'instrument': False,                # record a run report
+    'profile_dir': None,                # cProfile dumps per stage
+}
+
+
+def load_config(file: str = None, **overrides) -> dict:
+    """Builds a config from DEFAULTS, a json file and keyword overrides
+    (None overrides are ignored)"""
+    config = dict(DEFAULTS)
+    if file is not None:
+        with open(file) as f:
+            config.update(json.load(f))
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {sorted(unknown)}")
+    bad = [s for s in config['stages'] if s not in STAGES]
+    if bad:
+        raise ValueError(f"Unknown stages: {bad}")
+
+    return config
+
+
+def select(df, years: list = None, countries: list = None):
+    """Keeps the years and countries (the last column level) of df; Panels
+    are returned as they are when nothing is filtered"""
+    if isinstance(df, Panel):
+        if years is None and countries is None:
+            return df
+        df = df.to_frame()
+    if years is not None:
+        df = df.loc[str(years[0]):str(years[1])]
+    if countries is not None:
+        df = df.loc[:, df.columns.get_level_values(-1).isin(countries)]
+
+    return df
+
+
+# Readers for the inputs of stages that run without their predecessors
+def _load_raw(config):
+    import storage
+    import transform_data as td
+    if os.path.exists(config['out_path']+'raw'+storage.META):
+        return storage.open_panel(config['out_path']+'raw')
+    return td._read_output(config['out_path']+'raw.csv')
+
+
+def _load_z_scores(config):
+    import storage
+    import transform_data as td
+    if os.path.exists(config['out_path']+'z_scores'+storage.META):
+        return storage.open_panel(config['out_path']+'z_scores')
+    try:
+        return storage.load(config['out_path']+'z_scores.parquet')
+    except ImportError:
+        return td._read_output(config['out_path']+'z_scores.csv')
+
+
+def _load_sub_indices(config):
+    import storage
+    if os.path.exists(config['out_path']+'sub_indices'+storage.META):
+        return storage.open_panel(config['out_path']+'sub_indices')
+    return pd.read_csv(config['out_path']+'sub_indices.csv', header = [0,1], index_col = [0],
+                       parse_dates=True)
+
+
+LOADERS = {'raw': _load_raw, 'z_scores': _load_z_scores, 'sub_indices': _load_sub_indices}
+
+
+def _get(state: dict, name: str, config: dict):
+    """Returns an intermediate output, reading it from out_path if an
+    earlier stage did not produce it in this run"""
+    if name not in state:
+        state[name] = LOADERS[name](config)
+
+    return state[name]
+
+
+def run_import(state: dict, config: dict):
+    import transform_data as td
+    sources = td.run_importers(config['raw_path'], config['max_workers'], config['gdelt_chunksize'])
+    state['raw'] = td.merge_sources(sources)
+
+
+def run_quality(state: dict, config: dict):
+    import data_quality as dq
+    state['quality'] = dq.profile(_get(state, 'raw', config))
+    if config['write']:
+        state['quality_diff'] = dq.write_profile(state['quality'], config['out_path'])
+
+
+def run_normalise(state: dict, config: dict):
+    import transform_data as td
+    df = _get(state, 'raw', config)
+    max_age = td.MAX_AGE if config['max_age'] is None else config['max_age']
+    if config['write']:
+        outputs = td.incremental_build(df, config['out_path'], max_age)['outputs']
+    else:
+        outputs = dict(zip(['data', 'z_scores', 'maxmin', 'data_age'],
+                           td.build_outputs(df, max_age, with_age=True)))
+    state.update(outputs)
+
+
+def run_weights(state: dict, config: dict):
+    import construct_sub_idx as csi
+    z_scores = _get(state, 'z_scores', config)
+    if 'z_panel' not in state:
+        state['z_panel'] = z_scores if isinstance(z_scores, Panel) else Panel.from_frame(z_scores)
+    state['weights'] = csi.calculate_weights(state['z_panel'])
+
+
+def run_sub_indices(state: dict, config: dict):
+    import construct_sub_idx as csi
+    if 'weights' not in state:
+        run_weights(state, config)
+    sub_panel = csi.calculate_sub(state['z_panel'], state['weights'], config['missing'])
+    state['sub_panel'] = sub_panel
+    state['sub_indices'] = sub_panel.to_frame()
+    if config['write']:
+        import storage
+        state['sub_indices'].to_csv(config['out_path']+'sub_indices.csv')
+        storage.write_panel(sub_panel, config['out_path']+'sub_indices')
+
+
+def run_index(state: dict, config: dict):
+    import construct_index as ci
+    sub = state['sub_panel'] if 'sub_panel' in state else _get(state, 'sub_indices', config)
+    state['index'] = ci.calc_index(sub)
+    if config['write']:
+        import storage
+        state['index'].to_csv(config['out_path']+'index.csv')
+        storage.write_panel(state['index'], config['out_path']+'index', name='index')
+
+
+def run_fx(state: dict, config: dict):
+    import fx_analysis as fx
+    import countries
+    map_path = config['imf_map_path'] or config['out_path']
+    reer = fx.imf_import(config['raw_path'], config['fx_file'])
+    countries.register_aliases('imf', fx.import_imf_dic(map_path))
+    reer = countries.relabel(reer, 'imf')
+    state['reer'] = reer
+    state['reer_vol'] = fx.reer_vol(state['reer'])
+    if config['write']:
+        state['reer_vol'].to_csv(config['out_path']+'reer_vol.csv')
+
+
+RUNNERS = {'import': run_import, 'quality': run_quality, 'normalise': run_normalise,
+           'weights': run_weights, 'sub_indices': run_sub_indices, 'index': run_index,
+           'fx': run_fx}
+
+
+def run(config: dict = None, **overrides) -> dict:
+    """Runs the requested stages in-process, passing outputs in memory.
+
+    Stages always run in STAGES order. A stage whose inputs were not built
+    in this run reads them from the outputs of a previous run in out_path
+    (memory mapping the binary panel stores when they exist). Every stage
+    computes on and writes the full data, so the cross-sectional scores and
+    the files in out_path do not depend on the config's years and
+    countries, which only filter the returned outputs.
+
+    Args:
+        config: dict with the run configuration (see DEFAULTS).
+        overrides: config entries replacing those in config.
+
+    Returns:
+        state: dict with every intermediate output ('raw', 'quality',
+            'quality_diff', 'data', 'z_scores', 'maxmin', 'weights',
+            'sub_indices', 'index', 'reer', 'reer_vol' and the Panels shared
+            between stages)
+    """
+    config = load_config(**{**(config or {}), **overrides})
+    # Starting the run report afresh, and restoring the caller's
+    # instrumentation settings at the end
+    settings = {key: os.environ.get(key) for key in [instrument.ENV_FLAG, instrument.ENV_PROFILE]}
+    instrument.drain()
+    if config['instrument']:
+        instrument.enable(config['profile_dir'])
+    state = {}
+    try:
+        for name in STAGES:
+            if name in config['stages']:
+                RUNNERS[name](state, config)
+        if config['instrument'] and config['write']:
+            instrument.report(config['out_path']+'run_report.json')
+    finally:
+        for key, value in settings.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    # Filtering the returned outputs
+    for name in FILTERED:
+        if name in state:
+            out = select(state[name], config['years'], config['countries'])
+            if isinstance(state[name], Panel) and not isinstance(out, Panel):
+                out = Panel.from_frame(out)
+            state[name] = out
+
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the soft power index pipeline')
+    parser.add_argument('--config', help='json file with the run configuration')
+    parser.add_argument('--raw-path')
+    parser.add_argument('--out-path')
+    parser.add_argument('--stages', nargs='+', choices=STAGES)
+    parser.add_argument('--years', nargs=2, type=int, metavar=('FIRST', 'LAST'))
+    parser.add_argument('--countries', nargs='+')
+    parser.add_argument('--max-workers', type=int)
+    parser.add_argument('--gdelt-chunksize', type=int)
+    parser.add_argument('--no-write', dest='write', action='store_const', const=False)
+    parser.add_argument('--instrument', action='store_const', const=True)
+    parser.add_argument('--profile-dir')
+    args = vars(parser.parse_args())
+    file = args.pop('config')
+    # Trailing slashes keep the paths usable as file prefixes
+    for key in ['raw_path', 'out_path']:
+        if args[key] is not None:
+            args[key] = os.path.join(args[key], '')
+    config = load_config(file, **args)
+    run(config)
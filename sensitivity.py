@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 16:20:03 2026
+
+@author: talespadilha
+"""
+
+import numpy as np
+import pandas as pd
+
+from panel import Panel
+from construct_sub_idx import aggregate
+
+
+def draw_weights(rng: np.random.Generator, base: np.ndarray, alpha: float,
+                 size: int) -> np.ndarray:
+    """Draws size weight vectors from a Dirichlet centred on base.
+
+    Args:
+        rng: np.random.Generator used for the draws.
+        base: np.ndarray with the central weights (summing to one).
+        alpha: float with the concentration; larger values keep the draws
+            closer to base and None returns base itself for every draw.
+        size: int with the number of draws.
+
+    Returns:
+        w: np.ndarray with shape (size, len(base))
+    """
+    if alpha is None:
+        return np.tile(base, (size, 1))
+    w = np.zeros((size, len(base)))
+    support = base > 0
+    w[:, support] = rng.dirichlet(alpha*base[support], size=size)
+
+    return w
+
+
+def _ranks(x: np.ndarray) -> np.ndarray:
+    """Ranks (1 is the highest value) along the last axis; nas get rank 0"""
+    order = np.argsort(np.where(np.isnan(x), np.inf, -x), axis=-1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, x.shape[-1]+1), axis=-1)
+
+    return np.where(np.isnan(x), 0, ranks)
+
+
+def simulate(data, weights: dict, n_draws: int = 10000, sub_alpha: float = None,
+             var_alpha: float = None, chunk_size: int = 250, seed: int = None,
+             quantiles: tuple = (0.05, 0.5, 0.95)) -> pd.DataFrame:
+    """Monte Carlo of the Soft Power Index under perturbed weights.
+
+    Each draw perturbs the sub-index weights around equal weights (as in
+    calc_index) and the variable weights around the PCA weights, and then
+    recomputes the index for every country and date. Draws are processed in
+    chunks with all draws of a chunk aggregated together, and only running
+    sums and a per country-date histogram of ranks are kept, so memory does
+    not grow with n_draws.
+
+    Args:
+        data: pd.DataFrame or Panel with the normalised data.
+        weights: dict with the PCA weights from calculate_weights.
+        n_draws: int with the number of weight draws.
+        sub_alpha: float with the Dirichlet concentration of the sub-index
+            weights (the number of sub-indices gives a flat Dirichlet); None
+            keeps them equal.
+        var_alpha: float with the Dirichlet concentration of the variable
+            weights; None keeps the PCA weights.
+        chunk_size: int with the number of draws computed together.
+        seed: int with the random seed.
+        quantiles: tuple with the rank quantiles reported.
+
+    Returns:
+        stats: pd.DataFrame with dates as index and (stat, country) columns:
+            baseline index and rank, mean and std of the index, mean rank,
+            rank quantiles and the probabilities of a higher ('p_up'), lower
+            ('p_down') or any different ('p_change') rank than the baseline
+    """
+    panel = data if isinstance(data, Panel) else Panel.from_frame(data)
+    rng = np.random.default_rng(seed)
+    sub_idxs = panel.subindices
+    n_t, n_c = len(panel.dates), len(panel.countries)
+    # Selecting the weighted variables of each sub-index
+    subs = []
+    for idx in sub_idxs:
+        int_data = panel.subindex(idx)
+        w_all = weights[idx]
+        w_idx = w_all[w_all>0]
+        var_pos = int_data.variables.get_indexer(w_idx.index)
+        w_idx = w_idx[var_pos>=0]
+        var_pos = var_pos[var_pos>=0]
+        subs.append((int_data.values[:, var_pos], int_data.mask[var_pos],
+                     (w_idx/w_idx.sum()).to_numpy()))
+    sub_base = np.full(len(sub_idxs), 1/len(sub_idxs))
+
+    def index_draws(sub_w, var_ws):
+        """Index for a chunk of sub-index and variable weight draws"""
+        total = np.zeros((len(sub_w), n_t, n_c))
+        for s, (values, mask, _) in enumerate(subs):
+            total += sub_w[:, s, None, None]*aggregate(values, var_ws[s], mask, 'all')
+        return total
+
+    # Baseline index and ranks
+    base = index_draws(sub_base[None], [w[None] for _, _, w in subs])[0]
+    base_rank = _ranks(base)
+    # Running statistics
+    n_obs = np.zeros((n_t, n_c))
+    sums = np.zeros((n_t, n_c))
+    sq_sums = np.zeros((n_t, n_c))
+    rank_sums = np.zeros((n_t, n_c))
+    ups = np.zeros((n_t, n_c))
+    downs = np.zeros((n_t, n_c))
+    hist = np.zeros(n_t*n_c*(n_c+1), dtype=np.int64)
+    cell = np.arange(n_t*n_c).reshape(n_t, n_c)*(n_c+1)
+    for start in range(0, n_draws, chunk_size):
+        size = min(chunk_size, n_draws-start)
+        sub_w = draw_weights(rng, sub_base, sub_alpha, size)
+        var_ws = [draw_weights(rng, w, var_alpha, size) for _, _, w in subs]
+        idx_vals = index_draws(sub_w, var_ws)
+        ranks = _ranks(idx_vals)
+        valid = ~np.isnan(idx_vals)
+        n_obs += valid.sum(axis=0)
+        sums += np.where(valid, idx_vals, 0).sum(axis=0)
+        sq_sums += np.where(valid, idx_vals**2, 0).sum(axis=0)
+        rank_sums += ranks.sum(axis=0)
+        ups += (valid & (ranks < base_rank)).sum(axis=0)
+        downs += (valid & (ranks > base_rank)).sum(axis=0)
+        hist += np.bincount((cell+ranks).ravel(), minlength=len(hist))
+    # Summarising
+    hist = hist.reshape(n_t, n_c, n_c+1)[:, :, 1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums/n_obs
+        stats = {'base_index': base,
+                 'base_rank': np.where(base_rank > 0, base_rank, np.nan),
+                 'mean_index': mean,
+                 'std_index': np.sqrt(np.maximum(sq_sums/n_obs - mean**2, 0)),
+                 'mean_rank': rank_sums/n_obs}
+        cum = hist.cumsum(axis=2)
+        for q in quantiles:
+            q_rank = (cum < q*n_obs[:, :, None]).sum(axis=2)+1.0
+            stats[f'rank_q{q*100:g}'] = np.where(n_obs > 0, q_rank, np.nan)
+        stats['p_up'] = ups/n_obs
+        stats['p_down'] = downs/n_obs
+        stats['p_change'] = (ups+downs)/n_obs
+    stats = {k: pd.DataFrame(v, index=panel.dates, columns=panel.countries) for k, v in stats.items()}
+    stats = pd.concat(stats, axis=1, names=['stat', 'country'])
+    stats = stats.dropna(how='all')
+
+    return stats
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 14:02:48 2026
+
+@author: talespadilha
+"""
+
+import os
+import re
+import json
+import math
+import uuid
+import numpy as np
+import pandas as pd
+
+from panel import Panel
+
+# Rows per parquet row group: small enough for the statistics of the
+# contiguous label blocks to skip most of the file on a label filter
+ROW_GROUP = 65536
+# Binary panel store: values block and label sidecar extensions (the
+# sidecar names the block, so it alone marks a store as present)
+BIN, META = '.bin', '.json'
+
+
+def write_columnar(df: pd.DataFrame, file: str):
+    """Writes a df with (..., country) column levels to a parquet file.
+
+    The data is stored long, one (date, column levels..., value) row per
+    cell, with the rows of each column together and the columns in df's
+    order (so each subindex is one contiguous block). Labels are dictionary
+    encoded and missing values stored as nulls, and the row groups'
+    statistics let load skip the blocks a filter excludes.
+
+    Args:
+        df: pd.DataFrame with a date index and MultiIndex columns.
+        file: str with the path of the parquet file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    n_t, n_c = df.shape
+    arrays = {'date': pa.array(np.tile(df.index.to_numpy(), n_c))}
+    for i, name in enumerate(df.columns.names):
+        codes, labels = pd.factorize(df.columns.get_level_values(i))
+        arrays[name] = pa.DictionaryArray.from_arrays(pa.array(np.repeat(codes, n_t).astype(np.int32)),
+                                                      pa.array(labels.astype(str)))
+    arrays['value'] = pa.array(df.to_numpy(dtype=float).T.ravel(), from_pandas=True)
+    table = pa.table(arrays)
+    meta = {b'soft_power_levels': json.dumps(list(df.columns.names)).encode()}
+    pq.write_table(table.replace_schema_metadata(meta), file, row_group_size=ROW_GROUP)
+
+
+def _as_list(x) -> list:
+    return [x] if isinstance(x, str) else list(x)
+
+
+def load(file: str, subindex=None, variable=None, country=None, start=None,
+         end=None) -> pd.DataFrame:
+    """Reads a subset of a columnar store written by write_columnar.
+
+    The label and date filters are pushed down to the parquet reader, so
+    only the row groups they can match are read from disk.
+
+    Args:
+        file: str with the path of the parquet file.
+        subindex: str or list with the sub-indices to keep.
+        variable: str or list with the variables to keep.
+        country: str or list with the countries to keep.
+        start: first date to keep.
+        end: last date to keep.
+
+    Returns:
+        df: pd.DataFrame with a date index and the original column levels
+            (in their stored order)
+    """
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(file)
+    if 'value' not in schema.names:
+        raise ValueError(f"{file} uses the old wide layout; rebuild it with write_columnar")
+    levels = json.loads(schema.metadata[b'soft_power_levels'])
+    filters = []
+    for level, values in {'subindex': subindex, 'variable': variable, 'country': country}.items():
+        if values is not None and level in levels:
+            filters.append((level, 'in', _as_list(values)))
+    if start is not None:
+        filters.append(('date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('date', '<=', pd.Timestamp(end)))
+    table = pq.read_table(file, filters=filters or None)
+    # Back to a wide df, with columns and dates in their stored order
+    col_codes, columns = pd.factorize(pd.MultiIndex.from_arrays(
+        [table.column(name).to_pandas() for name in levels], names=levels))
+    date_codes, dates = pd.factorize(table.column('date').to_numpy())
+    values = np.full((len(dates), len(columns)), np.nan)
+    values[date_codes, col_codes] = table.column('value').to_numpy(zero_copy_only=False)
+    df = pd.DataFrame(values, index=pd.DatetimeIndex(dates), columns=columns.set_names(levels))
+
+    return df
+
+
+def _labels(index: pd.Index) -> dict:
+    """Serialisable labels of an axis"""
+    if isinstance(index, pd.DatetimeIndex):
+        return {'names': [index.name], 'dates': [x.isoformat() for x in index]}
+    if isinstance(index, pd.MultiIndex):
+        return {'names': list(index.names), 'values': [list(map(str, x)) for x in index]}
+
+    return {'names': [index.name], 'values': [str(x) for x in index]}
+
+
+def _index(labels: dict) -> pd.Index:
+    """Rebuilds an axis from _labels"""
+    if 'dates' in labels:
+        return pd.DatetimeIndex(labels['dates'], name=labels['names'][0])
+    if len(labels['names']) > 1:
+        return pd.MultiIndex.from_tuples([tuple(x) for x in labels['values']], names=labels['names'])
+
+    return pd.Index(labels['values'], name=labels['names'][0])
+
+
+def _blocks(file: str) -> list:
+    """Paths of the versioned value blocks of a store"""
+    folder, base = os.path.split(os.path.abspath(file))
+    pattern = re.compile(re.escape(base)+r'\.[0-9a-f]{12}'+re.escape(BIN)+'$')
+
+    return [os.path.join(folder, x) for x in os.listdir(folder) if pattern.match(x)]
+
+
+def write_panel(data, file: str, name: str = 'value'):
+    """Writes a Panel (or df) as a raw float64 block plus a json sidecar.
+
+    The (dates, variables, countries) values go in C order to a new block,
+    file.<version>.bin, and the labels, shape, mask and block name to
+    file.json, which is moved into place last. A reader therefore sees
+    either the old or the new store, never a mix. The previous block is
+    kept for readers that opened the old sidecar; older ones are removed.
+
+    Args:
+        data: Panel, or pd.DataFrame whose last column level is 'country'
+            (or with countries as its only columns, stored as one variable).
+        file: str with the path of the store, without extension.
+        name: str with the variable name for dfs with country columns only.
+    """
+    if not isinstance(data, Panel):
+        if data.columns.nlevels == 1:
+            columns = pd.MultiIndex.from_product([[name], data.columns], names=['variable', 'country'])
+            data = data.set_axis(columns, axis=1)
+        data = Panel.from_frame(data)
+    block = f'{os.path.basename(file)}.{uuid.uuid4().hex[:12]}{BIN}'
+    meta = {'shape': list(data.shape), 'dtype': 'float64', 'block': block,
+            'dates': _labels(data.dates), 'variables': _labels(data.variables),
+            'countries': _labels(data.countries), 'mask': np.packbits(data.mask).tobytes().hex()}
+    np.ascontiguousarray(data.values, dtype=np.float64).tofile(os.path.join(os.path.dirname(file), block))
+    previous = None
+    if os.path.exists(file+META):
+        with open(file+META) as f:
+            previous = json.load(f).get('block')
+    tmp = f'{file}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, file+META)
+    # Dropping blocks no sidecar refers to (and the unversioned layout)
+    keep = {block, previous}
+    for old in _blocks(file)+[file+BIN]:
+        if os.path.basename(old) not in keep and os.path.exists(old):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def open_panel(file: str, mode: str = 'r') -> Panel:
+    """Opens a store written by write_panel as a Panel backed by np.memmap.
+
+    Nothing is parsed or copied: the values are mapped from disk, so
+    processes opening the same store share its pages, and selections
+    (subindex, variable, country) stay views on the mapping.
+
+    Args:
+        file: str with the path of the store, without extension.
+        mode: str with the np.memmap mode ('r' read-only, 'c' copy on write).
+
+    Returns:
+        panel: Panel whose values are a np.memmap
+    """
+    with open(file+META) as f:
+        meta = json.load(f)
+    shape = tuple(meta['shape'])
+    block = os.path.join(os.path.dirname(file), meta['block']) if 'block' in meta else file+BIN
+    # A block that does not match the sidecar's shape is never mapped
+    size = math.prod(shape)*np.dtype(meta['dtype']).itemsize
+    if os.path.getsize(block) != size:
+        raise ValueError(f"{block} has {os.path.getsize(block)} bytes, expected {size} for shape {shape}")
+    values = np.memmap(block, dtype=meta['dtype'], mode=mode, shape=shape)
+    n_mask = shape[1]*shape[2]
+    mask = np.unpackbits(np.frombuffer(bytes.fromhex(meta['mask']), dtype=np.uint8))[:n_mask]
+    panel = Panel(values, _index(meta['dates']), _index(meta['variables']), _index(meta['countries']),
+                  mask.reshape(shape[1:]).astype(bool))
+
+    return panel
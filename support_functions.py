@@ -6,38 +6,279 @@ Created on Tue Nov 17 09:06:30 2020
 @author: talespadilha
 """
 
+import os
+import sys
+import hashlib
+import inspect
+import functools
 import pandas as pd
 import numpy as np
 
+import instrument
+import countries
+import panel
+from panel import ffill_values, ffill_frame
+
+# Default location of the raw data files
+WB_PATH = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/Raw Data/'
+# Folder (inside the raw files path) holding the cached importer outputs
+CACHE_DIR = '.cache'
+
 
 def split_df(df: pd.DataFrame, split_col: str, separate: str) -> pd.DataFrame:
     """Splits values in the same cell into different rows according to the
     separate argument given"""
-    split_df = (df.set_index(df.columns.drop(split_col,1).tolist())
-                .udnp_code.str.split(separate, expand=True)
-                .stack()
-                .reset_index()
-                .rename(columns={0:split_col})
-                .loc[:, df.columns]
+    split_df = (df.assign(**{split_col: df[split_col].str.split(separate)})
+                .explode(split_col, ignore_index=True)
+                .dropna(subset=[split_col])
+                .reset_index(drop=True)
                 )
     
     return split_df
 
 
-def wb_series(series: str) -> pd.DataFrame:
-    """ Imports an specific series from the WB file"""
-    # Setting the path
-    path = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/Raw Data/'
+def explode_count(df: pd.DataFrame, split_col: str, separate: str,
+                  time_col: str) -> pd.DataFrame:
+    """Cumulative count of rows per time and split value.
+
+    Cells of split_col holding several values (e.g. sites shared by more
+    than one country) are exploded into one row per value, without building
+    an intermediate frame as wide as the longest list.
+
+    Args:
+        df: pd.DataFrame with one row per item.
+        split_col: str with the column holding separated values.
+        separate: str with the separator.
+        time_col: str with the column holding the time of each item.
+
+    Returns:
+        counts: pd.DataFrame with times as index, split values as columns
+            and the cumulative number of items
+    """
+    split = split_df(df[[time_col, split_col]], split_col, separate)
+    counts = split.groupby([time_col, split_col]).size().unstack(fill_value=0)
+    counts = counts.cumsum().astype(float)
+    counts.columns.name = None
+
+    return counts
+
+
+# Process-wide cache of parsed WDI workbooks, keyed by file path
+_WB_CACHE = {}
+
+
+@instrument.stage()
+def wb_panel(files_path: str, file_name: str = 'WB.xlsx') -> pd.DataFrame:
+    """Imports a WDI-style workbook as a (year x (country, series)) panel.
+
+    The parsed frame is cached in memory by file path and modification time,
+    so repeated calls within the same run only parse the workbook once and a
+    changed file on disk is picked up on the next call.
+
+    Args:
+        files_path: str with the path for where the raw files are located.
+        file_name: str with the name of the workbook.
+
+    Returns:
+        wb_df: pd.DataFrame with years as index and (Country Code, Series
+            Name) columns
+    """
+    file = os.path.abspath(files_path+file_name)
+    mtime = os.path.getmtime(file)
+    cached = _WB_CACHE.get(file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
     # Importing data
-    wb_df = pd.read_excel(path+'WB.xlsx', header = [0], index_col = [0, 1, 2, 3])
+    wb_df = pd.read_excel(file, header = [0], index_col = [0, 1, 2, 3])
+    instrument.parsed(wb_df)
     wb_df.columns = [x[:4] for x in wb_df.columns]
     wb_df = wb_df.droplevel('Series Code')
     wb_df = wb_df.droplevel('Country Name')
     wb_df = wb_df.T.replace(['..', 0], np.nan)
-    # Transforming variables
     wb_df.index = pd.to_datetime(wb_df.index, format='%Y')
+    _WB_CACHE[file] = (mtime, wb_df)
+    
+    return wb_df
+
+
+def seed_wb_panel(files_path: str, wb_df: pd.DataFrame, file_name: str = 'WB.xlsx'):
+    """Stores an already parsed WDI panel in this process' cache"""
+    file = os.path.abspath(files_path+file_name)
+    _WB_CACHE[file] = (os.path.getmtime(file), wb_df)
+
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    """Forward fills nas along the first axis of an array"""
+    return ffill_values(values)[0]
+
+
+def wdi_extract(wb_df: pd.DataFrame, spec: list, ffill: bool = False) -> pd.DataFrame:
+    """Builds WDI variables from a wb_panel frame according to a spec.
+
+    The panel is laid out once as a (year, series, country) array and every
+    variable in spec is derived from it in a single step, so a new variable
+    only needs a new spec entry.
+
+    Args:
+        wb_df: pd.DataFrame from wb_panel.
+        spec: list of (series name, output name, denominator series name or
+            None, scale) tuples; denominators are forward filled.
+        ffill: bool for forward filling every series before deriving the
+            variables.
+
+    Returns:
+        df: pd.DataFrame with (variable, country) columns
+    """
+    # Reshaping into a (year, series, country) array
+    cc_pos, countries = pd.factorize(wb_df.columns.get_level_values(0))
+    ser_pos, series = pd.factorize(wb_df.columns.get_level_values(1))
+    cube = np.full((len(wb_df), len(series), len(countries)), np.nan)
+    cube[:, ser_pos, cc_pos] = wb_df.to_numpy(dtype=float)
+    present = np.zeros((len(series), len(countries)), dtype=bool)
+    present[ser_pos, cc_pos] = True
+    if ffill:
+        cube = _ffill(cube)
+    # Positions of the numerator and denominator series
+    num_pos = series.get_indexer([x[0] for x in spec])
+    dens = [x[2] for x in spec]
+    den_series = pd.Index([d for d in dens if d is not None]).unique()
+    den_series_pos = series.get_indexer(den_series)
+    missing = [x[0] for x, pos in zip(spec, num_pos) if pos < 0]
+    missing += list(den_series[den_series_pos < 0])
+    if missing:
+        raise KeyError(f"Series not in the WB panel: {missing}")
+    # Numerators, denominators and scales for every variable at once
+    num = cube[:, num_pos]
+    den = np.concatenate([np.ones((len(wb_df), 1, len(countries))),
+                          _ffill(cube[:, den_series_pos])], axis=1)
+    den_pos = [0 if d is None else den_series.get_loc(d)+1 for d in dens]
+    scale = np.array([x[3] for x in spec], dtype=float)[None, :, None]
+    values = num/den[:, den_pos]*scale
+    # Back to (variable, country) columns
+    var_pos, out_cc = np.nonzero(present[num_pos])
+    columns = pd.MultiIndex.from_arrays([[spec[i][1] for i in var_pos], countries[out_cc]],
+                                        names=['variable', 'country'])
+    df = pd.DataFrame(values[:, var_pos, out_cc], index=wb_df.index, columns=columns)
+
+    return df
+
+
+def wb_series(series: str, files_path: str = WB_PATH, ffill: bool = False) -> pd.DataFrame:
+    """ Imports an specific series from the WB file, forward filled if ffill"""
+    wb_df = wb_panel(files_path)
     df = wb_df.xs(series, axis=1, level=1).astype(float)
     df.columns.rename(None, inplace=True)
+    if ffill:
+        df = ffill_frame(df)[0]
+    
+    return df
+
+
+def file_hash(file: str) -> str:
+    """Returns the sha1 hex digest of a file's contents"""
+    sha = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def _write_cache(df: pd.DataFrame, file: str):
+    """Writes an importer output to parquet, keeping the index frequency"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df)
+    meta = dict(table.schema.metadata or {})
+    meta[b'soft_power_freq'] = (getattr(df.index, 'freqstr', None) or '').encode()
+    tmp_file = f'{file}.{os.getpid()}.tmp'
+    pq.write_table(table.replace_schema_metadata(meta), tmp_file)
+    os.replace(tmp_file, file)
+
+
+def _read_cache(file: str) -> pd.DataFrame:
+    """Reads an output written by _write_cache"""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(file)
+    df = table.to_pandas()
+    freq = (table.schema.metadata or {}).get(b'soft_power_freq', b'').decode()
+    if freq:
+        df.index.freq = freq
+
+    return df
+
+
+def cached_import(*file_names: str, deps: tuple = ()):
+    """Caches the output of an importer as a parquet file.
+
+    The cache file lives in CACHE_DIR next to the raw data and is keyed by a
+    hash of the source files' contents, the importer's module (so helpers
+    next to it count too), the shared helpers in this module, the country
+    registry and its aliases, the fill engine in panel, the module-level
+    settings in deps and any extra arguments, so it is rebuilt whenever one
+    of them changes. Each set of extra arguments keeps its own entry. If
+    pyarrow is not installed the importer simply runs uncached.
+
+    The decorated importer gets an is_cached(files_path, *args, **kwargs)
+    attribute telling whether a call would be served from the cache.
+
+    Args:
+        file_names: names of the raw files (relative to files_path) the
+            importer reads.
+        deps: module-level objects the importer reads (e.g. a WDI spec);
+            their repr at call time is part of the key.
+
+    Returns:
+        decorator to be applied to an importer taking files_path first.
+    """
+    def decorator(func):
+        def cache_file(files_path: str, args: tuple, kwargs: dict) -> str:
+            # Entries are named <importer>_<arguments hash>_<content hash>
+            call = repr((args, sorted(kwargs.items()))).encode()
+            sha = hashlib.sha1(call)
+            for module in [inspect.getmodule(func), sys.modules[__name__], countries, panel]:
+                sha.update(inspect.getsource(module).encode())
+            if os.path.exists(countries.ALIASES_FILE):
+                sha.update(file_hash(countries.ALIASES_FILE).encode())
+            sha.update(repr(deps).encode())
+            for name in file_names:
+                sha.update(file_hash(files_path+name).encode())
+            name = f'{func.__name__}_{hashlib.sha1(call).hexdigest()[:8]}_{sha.hexdigest()[:16]}.parquet'
+
+            return os.path.join(files_path, CACHE_DIR, name)
+
+        def is_cached(files_path: str, *args, **kwargs) -> bool:
+            return os.path.exists(cache_file(files_path, args, kwargs))
+
+        @functools.wraps(func)
+        def wrapper(files_path: str, *args, **kwargs):
+            file = cache_file(files_path, args, kwargs)
+            # Loading from cache when possible
+            if os.path.exists(file):
+                try:
+                    return _read_cache(file)
+                except ImportError:
+                    pass
+            df = func(files_path, *args, **kwargs)
+            # Writing the new cache entry and dropping stale ones for the
+            # same arguments
+            try:
+                os.makedirs(os.path.dirname(file), exist_ok=True)
+                _write_cache(df, file)
+            except ImportError:
+                return df
+            folder, name = os.path.split(file)
+            for old in os.listdir(folder):
+                if old.endswith('.parquet') and old != name \
+                        and old.rsplit('_', 1)[0] == name.rsplit('_', 1)[0]:
+                    os.remove(os.path.join(folder, old))
+
+            return df
+
+        wrapper.is_cached = is_cached
+
+        return wrapper
     
-    return df 
-    
\ No newline at end of file
+    return decorator
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+@author: talespadilha
+
+Checks the batched silhouettes against sklearn.
+"""
+import numpy as np
+import pytest
+
+import clustering
+
+metrics = pytest.importorskip('sklearn.metrics')
+
+
+def test_silhouettes():
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(40, 6))
+    labels = [rng.integers(0, k, size=len(X)) for k in range(2, 9)]
+    # Singleton clusters and an empty one
+    labels.append(np.r_[0, 1, np.full(len(X)-2, 3)])
+    scores = clustering.silhouettes(X, labels)
+    expected = [metrics.silhouette_score(X, lab) for lab in labels]
+    np.testing.assert_allclose(scores, expected, rtol=1e-10)
+
+
+def test_single_cluster():
+    X = np.random.default_rng(0).normal(size=(10, 3))
+    scores = clustering.silhouettes(X, [np.zeros(10, dtype=int), np.r_[np.zeros(5), np.ones(5)].astype(int)])
+    assert np.isnan(scores[0]) and not np.isnan(scores[1])
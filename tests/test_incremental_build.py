@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+@author: talespadilha
+
+Checks that incremental_build leaves the same outputs as a full rebuild.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import storage
+import transform_data as td
+from benchmarks import synthetic_panel
+
+
+@pytest.fixture
+def df():
+    return synthetic_panel(n_countries=30, n_years=25, n_vars=8, seed=1)
+
+
+def _out_path(tmp_path) -> str:
+    return str(tmp_path)+os.sep
+
+
+def _assert_full_rebuild(out_path: str, df: pd.DataFrame, changes: dict):
+    """Compares the csv, binary and parquet outputs and the returned ones
+    with build_outputs on the whole data"""
+    expected = dict(zip(td.COLUMNAR, td.build_outputs(df)))
+    for name, frame in expected.items():
+        csv = td._read_output(out_path+name+'.csv')
+        pd.testing.assert_frame_equal(csv, frame, check_freq=False)
+        stored = storage.open_panel(out_path+name).to_frame(columns=df.columns)
+        pd.testing.assert_frame_equal(stored, frame, check_freq=False)
+        returned = changes['outputs'][name].to_frame(columns=df.columns)
+        pd.testing.assert_frame_equal(returned, frame, check_freq=False)
+        parquet = storage.load(out_path+name+'.parquet')
+        pd.testing.assert_frame_equal(parquet, frame, check_freq=False, check_like=True)
+    raw = td._read_output(out_path+'raw.csv')
+    pd.testing.assert_frame_equal(raw, df, check_freq=False)
+
+
+def test_append(tmp_path, df):
+    out_path = _out_path(tmp_path)
+    td.incremental_build(df.iloc[:-3], out_path)
+    changes = td.incremental_build(df, out_path)
+    assert changes['dates'].equals(df.index[-3:])
+    _assert_full_rebuild(out_path, df, changes)
+
+
+def test_revision(tmp_path, df):
+    out_path = _out_path(tmp_path)
+    td.incremental_build(df, out_path)
+    revised = df.copy()
+    # A revised value and a newly reported one in early years
+    revised.iloc[3, 5] = revised.iloc[3, 5]*2
+    col = revised.iloc[:, 7]
+    revised.iloc[np.flatnonzero(col.isna().values)[0], 7] = 1.
+    changes = td.incremental_build(revised, out_path)
+    assert len(changes['dates']) > 0
+    _assert_full_rebuild(out_path, revised, changes)
+
+
+def test_no_change(tmp_path, df):
+    out_path = _out_path(tmp_path)
+    td.incremental_build(df, out_path)
+    files = [out_path+name+ext for name in td.STORES for ext in ['.csv', storage.META]]
+    before = {file: os.stat(file).st_mtime_ns for file in files}
+    changes = td.incremental_build(df, out_path)
+    assert len(changes['dates']) == 0 and len(changes['variables']) == 0
+    assert {file: os.stat(file).st_mtime_ns for file in files} == before
+    _assert_full_rebuild(out_path, df, changes)
+
+
+def test_new_column(tmp_path, df):
+    out_path = _out_path(tmp_path)
+    td.incremental_build(df.iloc[:, :-1], out_path)
+    changes = td.incremental_build(df, out_path)
+    _assert_full_rebuild(out_path, df, changes)
+
+
+def test_max_age(tmp_path, df):
+    out_path = _out_path(tmp_path)
+    max_age = {'var0': 2, 'var3': 1}
+    td.incremental_build(df.iloc[:-3], out_path, max_age)
+    changes = td.incremental_build(df, out_path, max_age)
+    expected = td.build_outputs(df, max_age, with_age=True)
+    pd.testing.assert_frame_equal(changes['outputs']['data'].to_frame(columns=df.columns),
+                                  expected[0], check_freq=False)
+    age = td._read_output(out_path+'data_age.csv')
+    pd.testing.assert_frame_equal(age, expected[3], check_freq=False)
+    stored = storage.open_panel(out_path+'data_age').to_frame(columns=df.columns)
+    pd.testing.assert_frame_equal(stored, expected[3], check_freq=False)
+    # Changing max_age rebuilds the outputs
+    changes = td.incremental_build(df, out_path)
+    _assert_full_rebuild(out_path, df, changes)
+    age = td._read_output(out_path+'data_age.csv')
+    pd.testing.assert_frame_equal(age, td.build_outputs(df, with_age=True)[3], check_freq=False)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+@author: talespadilha
+
+Checks z_norm and min_max_norm against a loop over the cross sections.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import transform_data as td
+from benchmarks import synthetic_panel
+from panel import Panel
+
+
+@pytest.fixture
+def df():
+    df = synthetic_panel(n_countries=25, n_years=12, n_vars=6, seed=2).round(1)
+    # A constant cross section and a date without observations
+    df.loc[df.index[4], df.columns.get_level_values('variable') == 'var1'] = 2.
+    df.iloc[7] = np.nan
+
+    return df
+
+
+def _score(sample: np.ndarray, values: np.ndarray, method: str, limits: tuple) -> np.ndarray:
+    """Scores values against one pooled cross section"""
+    sample = sample[~np.isnan(sample)]
+    if method == 'rank':
+        ranks = pd.Series(values).rank()
+        return ((ranks-1)/(ranks.count()-1)).to_numpy() if ranks.count() > 1 else values*np.nan
+    if len(sample) == 0:
+        return values*np.nan
+    if method == 'winsor':
+        lower, upper = np.percentile(sample, limits)
+        sample, values = np.clip(sample, lower, upper), np.clip(values, lower, upper)
+        centre = sample.mean()
+    else:
+        centre = np.median(sample)
+    if method == 'mad':
+        scale = 1.4826*np.median(np.abs(sample-centre))
+    else:
+        scale = sample.std(ddof=1) if len(sample) > 1 else np.nan
+
+    return (values-centre)/scale if scale > 0 else values*np.nan
+
+
+def _loop(df: pd.DataFrame, method: str, limits: tuple, window: int) -> pd.DataFrame:
+    panel = Panel.from_frame(df)
+    out = np.full(panel.shape, np.nan)
+    for t in range(len(panel.dates)):
+        for v in range(len(panel.variables)):
+            sample = panel.values[max(0, t-window+1):t+1, v].ravel()
+            out[t, v] = _score(sample, panel.values[t, v], method, limits)
+
+    return panel.copy(out).to_frame(columns=df.columns)
+
+
+@pytest.mark.parametrize('method,window', [('z', 1), ('mad', 1), ('winsor', 1), ('rank', 1),
+                                           ('z', 3), ('mad', 3), ('winsor', 3)])
+def test_z_norm(df, method, window):
+    got = td.z_norm(df, method=method, limits=(10, 90), window=window)
+    expected = _loop(df, method, (10, 90), window)
+    pd.testing.assert_frame_equal(got, expected, check_freq=False, rtol=1e-10)
+
+
+def test_z_norm_panel(df):
+    got = td.z_norm(Panel.from_frame(df), method='mad')
+    pd.testing.assert_frame_equal(got.to_frame(columns=df.columns), td.z_norm(df, method='mad'))
+
+
+def test_rank_window(df):
+    with pytest.raises(ValueError):
+        td.z_norm(df, method='rank', window=2)
+
+
+def test_min_max_norm(df):
+    got = td.min_max_norm(df)
+    by_date = df.T.groupby(level='variable')
+    expected = ((df.T - by_date.transform('min'))/(by_date.transform('max') - by_date.transform('min'))).T
+    expected[np.isinf(expected)] = np.nan
+    pd.testing.assert_frame_equal(got, expected, check_freq=False, rtol=1e-10)
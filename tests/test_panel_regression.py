@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+@author: talespadilha
+
+Checks the within transformation and spec_search against dummy variable OLS
+with the clustered sandwich.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import panel_regression as pr
+
+sm = pytest.importorskip('statsmodels.api')
+
+
+@pytest.fixture
+def data():
+    """Unbalanced (time, entity) panel with entity and time effects"""
+    rng = np.random.default_rng(3)
+    index = pd.MultiIndex.from_product([pd.date_range('2000', periods=12, freq='YS'),
+                                        [f'C{i}' for i in range(9)]], names=['date', 'country'])
+    n = len(index)
+    entity = pd.factorize(index.get_level_values(1))[0]
+    time = pd.factorize(index.get_level_values(0))[0]
+    X = rng.normal(size=(n, 3)) + rng.normal(size=9)[entity][:, None]
+    y = X @ [0.5, -1., 0.2] + rng.normal(size=9)[entity] + rng.normal(size=12)[time] + rng.normal(size=n)
+    df = pd.DataFrame(np.column_stack([y, X]), index=index, columns=['y', 'x1', 'x2', 'x3'])
+
+    return df[rng.random(n) > 0.2]
+
+
+def _dummies(df: pd.DataFrame) -> np.ndarray:
+    """Constant with entity and time dummies (first of each dropped)"""
+    entity = pd.get_dummies(df.index.get_level_values(1), drop_first=True, dtype=float)
+    time = pd.get_dummies(df.index.get_level_values(0), drop_first=True, dtype=float)
+
+    return np.column_stack([np.ones(len(df)), entity, time])
+
+
+def test_within_transform(data):
+    D = _dummies(data)
+    beta = np.linalg.lstsq(D, data.to_numpy(), rcond=None)[0]
+    residuals = data.to_numpy() - D @ beta
+    np.testing.assert_allclose(pr.within_transform(data).to_numpy(), residuals, atol=1e-8)
+
+
+def test_spec_search(data):
+    specs = [('x1',), ('x1', 'x2'), ('x2', 'x3'), ('x1', 'x2', 'x3')]
+    results = pr.spec_search(data, 'y', ['x1', 'x2', 'x3'], specs=specs).sort_index()
+    clusters = pd.factorize(data.index.get_level_values(1))[0]
+    G, n = len(np.unique(clusters)), len(data)
+    tss = (pr.within_transform(data[['y']])**2).to_numpy().sum()
+    for spec in specs:
+        fit = results.loc[('all', ' + '.join(spec))]
+        X = np.column_stack([data[list(spec)], _dummies(data)])
+        ols = sm.OLS(data['y'].to_numpy(), X).fit(cov_type='cluster',
+                                                   cov_kwds={'groups': clusters, 'use_correction': False})
+        k = len(spec)
+        correction = G/(G-1)*(n-1)/(n-k)
+        np.testing.assert_allclose(fit['coef'], ols.params[:k], rtol=1e-8)
+        np.testing.assert_allclose(fit['std_err'], np.sqrt(correction)*ols.bse[:k], rtol=1e-8)
+        np.testing.assert_allclose(fit['r2_within'], 1-ols.ssr/tss, rtol=1e-8)
+        assert (fit['nobs'] == n).all()
+
+
+def test_spec_search_groups(data):
+    groups = {'first': ['C0', 'C1', 'C2', 'C3', 'C4'], 'all': None}
+    results = pr.spec_search(data, 'y', ['x1', 'x2'], max_size=2, groups=groups)
+    sub = data[data.index.get_level_values(1).isin(groups['first'])]
+    alone = pr.spec_search(sub, 'y', ['x1', 'x2'], max_size=2)
+    pd.testing.assert_frame_equal(results.loc['first'], alone.loc['all'])
+    assert len(results.loc['all']) == 4
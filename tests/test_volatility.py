@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+@author: talespadilha
+
+Checks vol_panel against pandas rolling and ewm windows.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import volatility as vol
+
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(5)
+    index = pd.date_range('2010-01-01', periods=400, freq='B')
+    values = 100*np.exp(np.cumsum(rng.normal(scale=0.01, size=(400, 4)), axis=0))
+    # Gaps (and a late start) in some currencies
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:30, 2] = np.nan
+
+    return pd.DataFrame(values, index=index, columns=['AAA', 'BBB', 'CCC', 'DDD'])
+
+
+def _expected(r: pd.DataFrame, est: str, window: int, min_periods: int) -> pd.DataFrame:
+    """The estimator from pandas windows"""
+    if est == 'abs':
+        return r.abs().rolling(window, min_periods=min_periods).mean()
+    if est == 'rolling':
+        return r.rolling(window, min_periods=min_periods).std()
+    if est == 'realized':
+        return np.sqrt((r**2).rolling(window, min_periods=min_periods).sum())
+
+    return np.sqrt((r**2).ewm(span=window, adjust=False, ignore_na=True).mean())
+
+
+@pytest.mark.parametrize('min_periods', [None, 5])
+def test_vol_panel(prices, min_periods):
+    windows = (5, 21, 63)
+    panel = vol.vol_panel(prices, windows=windows, min_periods=min_periods, dropna=False)
+    r = 100*np.log(prices).diff()
+    for est in vol.ESTIMATORS:
+        for window in windows:
+            got = panel.xs((est, window), level=['estimator', 'window'])['vol'].unstack('currency')
+            expected = _expected(r, est, window, window if min_periods is None else min_periods)
+            pd.testing.assert_frame_equal(got, expected, check_names=False, check_freq=False,
+                                          rtol=1e-8)
+
+
+def test_log_returns(prices):
+    expected = 100*np.log(prices).diff().to_numpy()
+    np.testing.assert_allclose(vol.log_returns(prices), expected, rtol=1e-12)
+
+
+def test_unknown_estimator(prices):
+    with pytest.raises(ValueError):
+        vol.vol_panel(prices, estimators=('garch',))
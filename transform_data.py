@@ -7,15 +7,65 @@ Created on Mon Nov 16 15:44:17 2020
 """
 
 import os
+import json
+import warnings
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-
-os.chdir('/Users/talespadilha/Documents/Projects/soft_power')
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import support_functions as sf
+import storage
+import instrument
+import countries
+from panel import Panel, ffill_frame
 
 
+# WDI variables: (series name, output name, denominator series, scale)
+POP = 'Population, total'
+GDP = 'GDP (current US$)'
+WB_SPEC = [
+    # Tourists as share of population
+    ('International tourism, number of arrivals', 'int_tourists', POP, 100),
+    # Gross tertiary education
+    ('School enrollment, tertiary (% gross)', 'ter_education', None, 1),
+    # Articles as share of population
+    ('Scientific and technical journal articles', 'publications', POP, 100),
+    # Assistance as share of GDP
+    ('Net official development assistance and official aid received (current US$)', 'aid', GDP, 100),
+    # Refugees as share of population
+    ('Refugee population by country or territory of asylum', 'refugees', POP, 100),
+    # Migrants as share of population
+    ('International migrant stock (% of population)', 'migrants', None, 1),
+    # Internet users as share of population
+    ('Individuals using the Internet (% of population)', 'internet', None, 1),
+    # Mobile phones as share of population
+    ('Mobile cellular subscriptions', 'cellphones', POP, 100),
+    # Trademarks as share of population
+    ('Trademark applications, total', 'trademarks', POP, 100),
+    # Patents as share of population
+    ('Patent applications, residents', 'patents', POP, 100),
+]
+WBEDU_SPEC = [
+    # Ependiture in education
+    ('Government expenditure on education as % of GDP (%)', 'educ_expend', None, 1),
+    # Primary completion rate
+    ('Gross intake ratio to the last grade of primary education, both sexes (%)', 'prim_complet', None, 1),
+    # Average years of schooling
+    ('Barro-Lee: Average years of total schooling, age 25+, total', 'schooling_years', None, 1),
+    # Pisa maths
+    ('PISA: Mean performance on the mathematics scale', 'pisa_maths', None, 1),
+    # Pisa reading
+    ('PISA: Mean performance on the reading scale', 'pisa_reading', None, 1),
+    # Pisa science
+    ('PISA: Mean performance on the science scale', 'pisa_science', None, 1),
+]
+# Maximum number of years a variable's last observation is carried forward
+# (e.g. {'pisa_maths': 6}); variables not listed are carried indefinitely
+MAX_AGE = {}
+
+
+@instrument.stage()
+@sf.cached_import('WB.xlsx', deps=(WB_SPEC,))
 def wb_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from World Bank file
 
@@ -26,52 +76,15 @@ def wb_import(files_path: str) -> pd.DataFrame:
         df: pd.DataFrame with the final output
     """
     # Importing data
-    wb_df = pd.read_excel(files_path+'WB.xlsx', header = [0], index_col = [0, 1, 2, 3])
-    wb_df.columns = [x[:4] for x in wb_df.columns]
-    wb_df = wb_df.droplevel('Series Code')
-    wb_df = wb_df.droplevel('Country Name')
-    wb_df = wb_df.T.replace(['..', 0], np.nan)
+    wb_df = sf.wb_panel(files_path)
     # Transforming variables
-    wb_df.index = pd.to_datetime(wb_df.index, format='%Y')
-    wb = {}
-    pop = wb_df.xs('Population, total', axis=1, level=1).astype(float).fillna(method='ffill')
-    gdp = wb_df.xs('GDP (current US$)', axis=1, level=1).astype(float).fillna(method='ffill')
-    # Tourists as share of population
-    col = 'International tourism, number of arrivals'
-    wb['int_tourists'] = (wb_df.xs(col, axis=1, level=1)/pop)*100
-    # Gross tertiary education
-    col = 'School enrollment, tertiary (% gross)'
-    wb['ter_education'] = wb_df.xs(col, axis=1, level=1)
-    # Articles as share of population
-    col = 'Scientific and technical journal articles'
-    wb['publications'] = (wb_df.xs(col, axis=1, level=1)/pop)*100
-    # Assistance as share of GDP
-    col = 'Net official development assistance and official aid received (current US$)'
-    wb['aid'] = (wb_df.xs(col, axis=1, level=1)/gdp)*100
-    # Refugees as share of population
-    col = 'Refugee population by country or territory of asylum'
-    wb['refugees'] = (wb_df.xs(col, axis=1, level=1)/pop)*100
-    # Migrants as share of population
-    col = 'International migrant stock (% of population)'
-    wb['migrants'] = wb_df.xs(col, axis=1, level=1)
-    # Internet users as share of population
-    col = 'Individuals using the Internet (% of population)'
-    wb['internet'] = wb_df.xs(col, axis=1, level=1)
-    # Mobile phones as share of population
-    col = 'Mobile cellular subscriptions'
-    wb['cellphones'] = (wb_df.xs(col, axis=1, level=1)/pop)*100
-    # Trademarks as share of population
-    col = 'Trademark applications, total'
-    wb['trademarks'] = (wb_df.xs(col, axis=1, level=1)/pop)*100
-    # Patents as share of population
-    col = 'Patent applications, residents'
-    wb['patents'] = (wb_df.xs(col, axis=1, level=1)/pop)*100
-    df = pd.concat(wb, axis=1, names=["variable"])
-    df.columns.set_names('country', level='Country Code', inplace=True)
+    df = sf.wdi_extract(wb_df, WB_SPEC)
     
     return df 
 
 
+@instrument.stage()
+@sf.cached_import('Education_WDI.xlsx', deps=(WBEDU_SPEC, MAX_AGE))
 def wbedu_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from World Bank educaton file
 
@@ -82,38 +95,15 @@ def wbedu_import(files_path: str) -> pd.DataFrame:
         df: pd.DataFrame with the final output
     """
     # Importing data
-    wb_df = pd.read_excel(files_path+'Education_WDI.xlsx', header = [0], index_col = [0, 1, 2, 3])
-    wb_df.columns = [x[:4] for x in wb_df.columns]
-    wb_df = wb_df.droplevel('Series Code')
-    wb_df = wb_df.droplevel('Country Name')
-    wb_df = wb_df.T.replace(['..', 0], np.nan)
+    wb_df = sf.wb_panel(files_path, 'Education_WDI.xlsx')
     # Transforming variables
-    wb_df.index = pd.to_datetime(wb_df.index, format='%Y')
-    wb = {}
-    # Ependiture in education
-    col = 'Government expenditure on education as % of GDP (%)'
-    wb['educ_expend'] = wb_df.xs(col, axis=1, level=1)
-    # Primary completion rate
-    col = 'Gross intake ratio to the last grade of primary education, both sexes (%)'
-    wb['prim_complet'] = wb_df.xs(col, axis=1, level=1)    
-    # Average years of schooling
-    col = 'Barro-Lee: Average years of total schooling, age 25+, total'
-    wb['schooling_years'] = wb_df.xs(col, axis=1, level=1) 
-    # Pisa maths
-    col = 'PISA: Mean performance on the mathematics scale'
-    wb['pisa_maths'] = wb_df.xs(col, axis=1, level=1)     
-    # Pisa reading
-    col = 'PISA: Mean performance on the reading scale'
-    wb['pisa_reading'] = wb_df.xs(col, axis=1, level=1)
-    # Pisa science
-    col = 'PISA: Mean performance on the science scale'
-    wb['pisa_science'] = wb_df.xs(col, axis=1, level=1)
-    df = pd.concat(wb, axis=1, names=["variable"]).fillna(method='ffill').fillna(method='bfill', limit=10)
-    df.columns.set_names('country', level='Country Code', inplace=True)
+    df = ffill_frame(sf.wdi_extract(wb_df, WBEDU_SPEC), MAX_AGE, back_limit=10)[0]
     
     return df 
-    
 
+
+@instrument.stage()
+@sf.cached_import('ICRG.xlsx')
 def icrg_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from icrg file
 
@@ -125,6 +115,7 @@ def icrg_import(files_path: str) -> pd.DataFrame:
     """
     # Importing data
     icrg_df = pd.read_excel(files_path+'ICRG.xlsx', header = [0], index_col = [0, 1, 2])
+    instrument.parsed(icrg_df)
     var_set = ['Bureaucracy Quality (L)', 'Democratic Accountability (K)',
            'Government Stability (A)', 'Law & Order (I)', 'Corruption (F)']
     icrg_df = icrg_df.reindex(var_set, level='Variable').T
@@ -140,10 +131,13 @@ def icrg_import(files_path: str) -> pd.DataFrame:
     icrg["corruption"] = icrg_df.xs('Corruption (F)', axis=1, level='Variable')
     df = pd.concat(icrg, axis=1, names=["variable"])
     df.columns.set_names('country', level='Code', inplace=True)
+    df = countries.relabel(df, 'icrg')
 
     return df
 
 
+@instrument.stage()
+@sf.cached_import('UNESCO_WHC.xls')
 def whc_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from UNESCO World Heritage Centres file
 
@@ -155,23 +149,22 @@ def whc_import(files_path: str) -> pd.DataFrame:
     """
     # Importing data
     whc_df = pd.read_excel(files_path+'UNESCO_WHC.xls', header = [0])
+    instrument.parsed(whc_df)
     whc_df = whc_df.reindex(['date_inscribed', 'udnp_code'], axis=1)  
-    # Splitting multicountry centres
-    whc_df = sf.split_df(whc_df, split_col='udnp_code', separate=',')
     whc_df['udnp_code'] = whc_df['udnp_code'].str.upper()
+    # Splitting multicountry centres and counting cumulative sites
+    whc_df = sf.explode_count(whc_df, split_col='udnp_code', separate=',', time_col='date_inscribed')
     # Transforming variables
-    whc_df = sm.add_constant(whc_df)
-    whc_df = whc_df.groupby(['date_inscribed', 'udnp_code']).count()
-    whc_df = whc_df.unstack(level='udnp_code') 
-    whc_df = whc_df.cumsum().fillna(method='ffill').fillna(0)
     whc_df.index = pd.to_datetime(whc_df.index, format='%Y')
     whc_df.index.name = None
-    whc_df.columns = whc_df.columns.droplevel(0)
     whc_df.columns = pd.MultiIndex.from_product([['whc'], whc_df.columns]).set_names(['variable', 'country'])
+    whc_df = countries.relabel(whc_df, 'unesco')
     
     return whc_df
 
 
+@instrument.stage()
+@sf.cached_import('cultural_goods.xlsx', 'WB.xlsx')
 def cult_goods_export(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from UNCTAD export of cultural goods file
     
@@ -183,19 +176,25 @@ def cult_goods_export(files_path: str) -> pd.DataFrame:
     """
     # Importing 
     cult_df = pd.read_excel(files_path+'cultural_goods.xlsx', header = [0], index_col = [0,1])
+    instrument.parsed(cult_df)
     cult_df = cult_df.iloc[1:,:].T.replace('..', np.nan)
     # Transforming
     cult_df.columns = cult_df.columns.droplevel(0)
+    cult_df = countries.relabel(cult_df, 'unctad')
     cult_df.index = pd.to_datetime(cult_df.index, format='%Y')
     # Getting GDP    
-    gdp =  sf.wb_series('GDP (current US$)').fillna(method='ffill')
-    # Final df
-    df = (cult_df/gdp)*100
+    gdp =  sf.wb_series('GDP (current US$)', files_path, ffill=True)
+    # Final df (on all countries and dates of both sources)
+    cc = cult_df.columns.union(gdp.columns)
+    dates = cult_df.index.union(gdp.index)
+    df = (cult_df.reindex(index=dates, columns=cc).astype(float)/gdp.reindex(index=dates, columns=cc))*100
     df.columns = pd.MultiIndex.from_product([['cult_exp'], df.columns]).set_names(['variable', 'country'])
     
     return df
 
 
+@instrument.stage()
+@sf.cached_import('olympics.xlsx', 'WB.xlsx')
 def olymp_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from olympic medals file
     
@@ -207,22 +206,27 @@ def olymp_import(files_path: str) -> pd.DataFrame:
     """
     # Importing
     medals = pd.read_excel(files_path+'olympics.xlsx', header = [0], index_col = [0,1,2])
+    instrument.parsed(medals)
     medals = medals.unstack(level='Year')
     medals = medals.T
     medals.index = medals.index.droplevel(0)
     medals.index = pd.to_datetime(medals.index, format='%Y')
     medals.columns = medals.columns.droplevel('Country')
     medals = medals.drop(columns='Olympic Team')
+    medals = countries.relabel(medals, 'olympics')
     # Transforming
-    population =  sf.wb_series('Population, total').fillna(method='ffill')
-    pop = population.reindex(medals.columns, axis=1)
-    df = ((medals.div(pop)).fillna(method='ffill'))*10000000
+    population =  sf.wb_series('Population, total', files_path, ffill=True)
+    dates = medals.index.union(population.index)
+    pop = population.reindex(index=dates, columns=medals.columns)
+    df = ffill_frame(medals.reindex(dates).astype(float)/pop)[0]*10000000
     df = df.dropna(axis=1, how='all')
     df.columns = pd.MultiIndex.from_product([['medals'], df.columns]).set_names(['variable', 'country'])
     
     return df 
 
 
+@instrument.stage()
+@sf.cached_import('lowy.csv')
 def lowy_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from lowy embassies file
     
@@ -234,14 +238,18 @@ def lowy_import(files_path: str) -> pd.DataFrame:
     """
     # Importing
     emb = pd.read_csv(files_path+'lowy.csv', header = [0], index_col = [0,1])
+    instrument.parsed(emb)
     emb = emb.T
     emb.columns = emb.columns.droplevel('Country')
     emb.index = pd.to_datetime(emb.index, format='%Y')
     emb.columns = pd.MultiIndex.from_product([['emb'], emb.columns]).set_names(['variable', 'country'])
+    emb = countries.relabel(emb, 'lowy')
 
     return emb
 
 
+@instrument.stage()
+@sf.cached_import('ofi.xlsx', 'WB.xlsx')
 def ofi_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from outward foreign investment file
     
@@ -253,21 +261,26 @@ def ofi_import(files_path: str) -> pd.DataFrame:
     """
     # Importing 
     ofi = pd.read_excel(files_path+'ofi.xlsx', header = [0], index_col = [0,1])
+    instrument.parsed(ofi)
     ofi = ofi.T.replace(['..', ['_']], np.nan)
     ofi = ofi.drop(columns=('Country', 'Code'))
     # Transforming
     ofi.columns = ofi.columns.droplevel(0)
+    ofi = countries.relabel(ofi, 'unctad')
     ofi.index = pd.to_datetime(ofi.index, format='%Y')    
     # Getting GDP
-    gdp =  sf.wb_series('GDP (current US$)').fillna(method='ffill')
-    gdp_div = gdp.reindex(ofi.columns, axis=1)
+    gdp =  sf.wb_series('GDP (current US$)', files_path, ffill=True)
+    dates = ofi.index.union(gdp.index)
+    gdp_div = gdp.reindex(index=dates, columns=ofi.columns)
     # Final df
-    df = ((ofi*10**6)/gdp_div)*100
+    df = ((ofi.reindex(dates).astype(float)*10**6)/gdp_div)*100
     df.columns = pd.MultiIndex.from_product([['ofi'], df.columns]).set_names(['variable', 'country'])
 
     return df
 
 
+@instrument.stage()
+@sf.cached_import('GCI.xlsx')
 def gci_import(files_path: str) -> pd.DataFrame:
     """Imports and transforms data from global competitiveness index file
     
@@ -278,100 +291,475 @@ def gci_import(files_path: str) -> pd.DataFrame:
         df: pd.DataFrame with the final output
     """
     gci = pd.read_excel(files_path+'GCI.xlsx', header = [0], index_col = [0, 1, 2, 3, 4])
+    instrument.parsed(gci)
     gci = gci.T  
     gci.columns = gci.columns.droplevel(['Country Name', 'Indicator Id', 'Indicator', 'Subindicator Type'])
     gci.index = pd.to_datetime(gci.index, format='%Y')   
     gci.columns = pd.MultiIndex.from_product([['gci'], gci.columns]).set_names(['variable', 'country'])
+    gci = countries.relabel(gci, 'wef')
 
     return gci
 
 
-def gdelt_import(files_path: str) -> pd.DataFrame:
+def _stream_counts(file: str, chunksize: int) -> pd.DataFrame:
+    """Sums a (date, country) event count csv by country-year in chunks"""
+    header = pd.read_csv(file, nrows=0)
+    date_col, cc_col = header.columns[:2]
+    dtypes = {col: 'float64' for col in header.columns[2:]}
+    dtypes.update({date_col: 'str', cc_col: 'str'})
+    total, n_rows = None, 0
+    for chunk in pd.read_csv(file, dtype=dtypes, chunksize=chunksize):
+        n_rows += len(chunk)
+        # Accumulating country-year sums; dates may be years, months or days
+        years = chunk[date_col].str[:4].astype(int).rename(date_col)
+        sums = chunk.drop(columns=date_col).groupby([years, cc_col]).sum()
+        total = sums if total is None else total.add(sums, fill_value=0)
+    df = total.unstack(level=cc_col)
+    instrument.parsed((n_rows, len(header.columns)))
+
+    return df
+
+
+@instrument.stage()
+@sf.cached_import('gdelt_dc.csv', 'gdelt_all.csv')
+def gdelt_import(files_path: str, chunksize: int = None) -> pd.DataFrame:
     """Imports and transforms data from gdelt files
     
     Args:
         files_path: str with the path for where the raw files are located.
+        chunksize: int with the number of rows read at a time; if given the
+            files are streamed and summed by country-year, which keeps memory
+            bounded for daily or monthly counts.
         
     Returns:
         df: pd.DataFrame with the final output
     """
     # Importing data
-    df_dc = pd.read_csv(files_path+'gdelt_dc.csv', header = [0], index_col = [0,1])
-    df_dc = df_dc.unstack(level='country')        
-    df_all = pd.read_csv(files_path+'gdelt_all.csv', header = [0], index_col = [0,1])
-    df_all = df_all.unstack(level='country')
+    if chunksize is None:
+        df_dc = pd.read_csv(files_path+'gdelt_dc.csv', header = [0], index_col = [0,1])
+        instrument.parsed(df_dc)
+        df_dc = df_dc.unstack(level='country')        
+        df_all = pd.read_csv(files_path+'gdelt_all.csv', header = [0], index_col = [0,1])
+        instrument.parsed(df_all)
+        df_all = df_all.unstack(level='country')
+    else:
+        df_dc = _stream_counts(files_path+'gdelt_dc.csv', chunksize)
+        df_all = _stream_counts(files_path+'gdelt_all.csv', chunksize)
     # Transforming
     df = (df_dc/df_all)*100
     df.index = pd.to_datetime(df.index, format='%Y')   
     df.columns = df.columns.droplevel(0)
     df.columns = pd.MultiIndex.from_product([['gdelt'], df.columns]).set_names(['variable', 'country'])
+    df = countries.relabel(df, 'gdelt')
     
     return df.loc[:'2019-01-01']
 
 
-def min_max_norm(df_entry: pd.DataFrame) -> pd.DataFrame:
-    """Normalises df according to min-max method"""
-    df = df_entry.copy()
-    subidx = list(set(df.columns.get_level_values('subindex')))
-    for idx in subidx:
-        si_df = df.xs(idx, axis=1, level='subindex')
-        var_set = list(set(si_df.columns.get_level_values('variable')))
-        for var in var_set:
-            sample = si_df.xs(var, axis=1, level='variable')
-            maxi = sample.max(axis=1)
-            mini = sample.min(axis=1)
-            norm = sample.sub(mini, axis='index').div(maxi-mini, axis='index')
-            df[(idx, var)] = norm.copy()
+# Import graph: source name -> (task, names of the tasks it depends on). The
+# 'wb_panel' task parses WB.xlsx once for its dependants; it only runs when
+# one of them misses its cache, and dependants served from the cache do not
+# wait for it.
+IMPORT_GRAPH = {
+    'wb_panel': (sf.wb_panel, []),
+    'wb': (wb_import, ['wb_panel']),
+    'wb_edu': (wbedu_import, []),
+    'icrg': (icrg_import, []),
+    'whc': (whc_import, []),
+    'cult_exp': (cult_goods_export, ['wb_panel']),
+    'medals': (olymp_import, ['wb_panel']),
+    'emb': (lowy_import, []),
+    'ofi': (ofi_import, ['wb_panel']),
+    'gci': (gci_import, []),
+    'gdelt': (gdelt_import, []),
+}
+
+
+def _run_task(task, files_path: str, kwargs: dict, wb_df: pd.DataFrame = None) -> tuple:
+    """Runs an import task, seeding the WB cache with wb_df if given, and
+    returns its output with the worker's instrumentation records"""
+    if wb_df is not None:
+        sf.seed_wb_panel(files_path, wb_df)
+    df = task(files_path, **kwargs)
+
+    return df, instrument.drain()
+
+
+@instrument.stage()
+def run_importers(files_path: str, max_workers: int = None, gdelt_chunksize: int = None) -> dict:
+    """Runs all importers in IMPORT_GRAPH in a process pool.
+
+    Tasks are submitted as soon as the tasks they depend on have finished,
+    so independent sources are imported concurrently. Importers with a
+    valid parquet cache return it without touching the raw files, and the
+    WB panel is parsed at most once, only if an importer needing it runs.
+
+    Args:
+        files_path: str with the path for where the raw files are located.
+        max_workers: int with the number of processes; 1 runs the tasks
+            sequentially in the current process.
+        gdelt_chunksize: int with the rows per chunk for streaming the GDELT
+            files (see gdelt_import); None reads them whole.
+
+    Returns:
+        sources: dict with each source name and its imported pd.DataFrame
+    """
+    # Extra arguments of each importer (left out when unset, so the cache
+    # key of the default call does not change)
+    options = {name: {} for name in IMPORT_GRAPH}
+    if gdelt_chunksize is not None:
+        options['gdelt']['chunksize'] = gdelt_chunksize
+    # Dropping the dependencies of importers served from their cache
+    graph = {}
+    for name, (task, deps) in IMPORT_GRAPH.items():
+        if deps and task.is_cached(files_path, **options[name]):
+            deps = []
+        graph[name] = (task, deps)
+    if not any('wb_panel' in deps for _, deps in graph.values()):
+        del graph['wb_panel']
+    results = {}
+    if max_workers == 1:
+        for name, (task, _) in graph.items():
+            results[name] = task(files_path, **options[name])
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            running = {}
+            pending = dict(graph)
+            while pending or running:
+                # Submitting every task whose dependencies are done
+                for name, (task, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        wb_df = results['wb_panel'] if 'wb_panel' in deps else None
+                        running[pool.submit(_run_task, task, files_path, options[name], wb_df)] = name
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)], records = future.result()
+                    instrument.collect(records)
+    sources = {k: v for k, v in results.items() if k != 'wb_panel'}
+
+    return sources
+
+
+@instrument.stage()
+def merge_sources(sources: dict) -> pd.DataFrame:
+    """Merges the imported sources into the (subindex, variable, country) df"""
+    wb = sources['wb']
+    df = {}
+    df['institutions'] = sources['icrg'][['rule_of_law', 'gov_stability', 'dem_account', 'bur_effect', 'corruption']]
+    df['culture'] = pd.concat([wb[['int_tourists']], sources['whc'], sources['cult_exp'], sources['medals']], axis=1)
+    df['comercial'] = pd.concat([wb[['patents', 'trademarks']], sources['ofi'], sources['gci']], axis=1)
+    df['digital'] = wb[['internet', 'cellphones']]
+    df['global_reach'] = pd.concat([wb[['aid', 'migrants', 'refugees']], sources['emb'], sources['gdelt']], axis=1)
+    df['education'] = pd.concat([ wb[['ter_education', 'publications']], sources['wb_edu']], axis=1)
+    df = pd.concat(df, axis=1, names=['subindex'])
+
+    return df
+
+
+# Cross sectional scores of z_norm:
+#   'z' - centred on the median and scaled by the standard deviation
+#   'mad' - centred on the median and scaled by 1.4826 times the median
+#           absolute deviation (the std under normality)
+#   'winsor' - values clipped at the limits percentiles, then centred on the
+#              mean and scaled by the std of the clipped values
+#   'rank' - percentile of the country's rank (0 lowest, 1 highest, ties
+#            get their average rank)
+Z_METHODS = ('z', 'mad', 'winsor', 'rank')
+
+
+def _pooled(cube: np.ndarray, window: int) -> np.ndarray:
+    """Pools every date's cross section with the window-1 previous ones into
+    a (dates, variables, countries*window) array (shorter at the start)"""
+    if window == 1:
+        return cube
+    pad = np.full((window-1,)+cube.shape[1:], np.nan)
+    view = np.lib.stride_tricks.sliding_window_view(np.concatenate([pad, cube]), window, axis=0)
+
+    return view.reshape(cube.shape[0], cube.shape[1], -1)
+
+
+def _percentile_ranks(cube: np.ndarray) -> np.ndarray:
+    """Percentile ranks along the last axis, from sorting once: ties get the
+    average of their positions and cross sections with less than two values
+    are left missing"""
+    order = np.argsort(cube, axis=-1)
+    ordered = np.take_along_axis(cube, order, axis=-1)
+    pos = np.arange(cube.shape[-1])
+    # Start and end positions of every run of equal values
+    starts = np.ones(cube.shape, dtype=bool)
+    starts[..., 1:] = ordered[..., 1:] != ordered[..., :-1]
+    ends = np.ones(cube.shape, dtype=bool)
+    ends[..., :-1] = starts[..., 1:]
+    first = np.maximum.accumulate(np.where(starts, pos, 0), axis=-1)
+    last = np.minimum.accumulate(np.where(ends, pos, cube.shape[-1])[..., ::-1], axis=-1)[..., ::-1]
+    ranks = np.empty(cube.shape)
+    np.put_along_axis(ranks, order, (first+last)/2, axis=-1)
+    n = (~np.isnan(cube)).sum(axis=-1, keepdims=True)
+
+    return np.where(np.isnan(cube) | (n < 2), np.nan, ranks/(n-1))
+
+
+@instrument.stage()
+def min_max_norm(df_entry, limits: tuple = None):
+    """Normalises df (or Panel) according to min-max method, optionally
+    clipping every cross section at the limits percentiles first"""
+    panel = df_entry if isinstance(df_entry, Panel) else Panel.from_frame(df_entry)
+    cube = panel.values
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if limits is not None:
+            lower, upper = np.nanpercentile(cube, limits, axis=2, keepdims=True)
+            cube = np.clip(cube, lower, upper)
+        maxi = np.nanmax(cube, axis=2, keepdims=True)
+        mini = np.nanmin(cube, axis=2, keepdims=True)
+        norm = panel.copy((cube-mini)/(maxi-mini))
+    if isinstance(df_entry, Panel):
+        return norm
+    df = norm.to_frame(columns=df_entry.columns)
             
     return df 
 
 
-def z_norm(df_entry: pd.DataFrame) -> pd.DataFrame:
-    """Normalises df according to cross sectional z score method"""
-    df = df_entry.copy()
-    subidx = list(set(df.columns.get_level_values('subindex')))
-    for idx in subidx:
-        si_df = df.xs(idx, axis=1, level='subindex')
-        var_set = list(set(si_df.columns.get_level_values('variable')))
-        for var in var_set:
-            sample = si_df.xs(var, axis=1, level='variable')
-            mean = sample.median(axis=1)
-            std = sample.std(axis=1)
-            norm = sample.sub(mean, axis='index').div(std, axis='index')
-            df[(idx, var)] = norm.copy()
+@instrument.stage()
+def z_norm(df_entry, method: str = 'z', limits: tuple = (5, 95), window: int = 1):
+    """Normalises df (or Panel) according to a cross sectional score.
+
+    Centres and scales of every variable and date are computed at once with
+    nan-aware reductions over the countries axis. Dates without any
+    observation, and cross sections with an undefined or zero scale, are
+    left missing.
+
+    Args:
+        df_entry: pd.DataFrame or Panel with the data.
+        method: str with the score from Z_METHODS.
+        limits: tuple with the lower and upper percentiles for 'winsor'.
+        window: int with the number of years pooled (the current one and
+            the window-1 previous ones) for the centre and scale; not
+            available for 'rank'.
+
+    Returns:
+        norm: normalised pd.DataFrame or Panel (as df_entry)
+    """
+    panel = df_entry if isinstance(df_entry, Panel) else Panel.from_frame(df_entry)
+    cube = panel.values
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if method == 'rank':
+            if window != 1:
+                raise ValueError("Pooled windows are not available for 'rank'")
+            values = _percentile_ranks(cube)
+        else:
+            sample = _pooled(cube, window)
+            if method == 'z':
+                centre = np.nanmedian(sample, axis=2, keepdims=True)
+                scale = np.nanstd(sample, axis=2, ddof=1, keepdims=True)
+            elif method == 'mad':
+                centre = np.nanmedian(sample, axis=2, keepdims=True)
+                scale = 1.4826*np.nanmedian(np.abs(sample-centre), axis=2, keepdims=True)
+            elif method == 'winsor':
+                lower, upper = np.nanpercentile(sample, limits, axis=2, keepdims=True)
+                sample = np.clip(sample, lower, upper)
+                cube = np.clip(cube, lower, upper)
+                centre = np.nanmean(sample, axis=2, keepdims=True)
+                scale = np.nanstd(sample, axis=2, ddof=1, keepdims=True)
+            else:
+                raise ValueError(f"Unknown normalisation method: {method}")
+            values = (cube-centre)/np.where(scale > 0, scale, np.nan)
+        norm = panel.copy(values)
+    if isinstance(df_entry, Panel):
+        return norm
+    df = norm.to_frame(columns=df_entry.columns)
             
     return df 
 
 
+def _build_panels(panel: Panel, max_age: dict) -> tuple:
+    """Fills a raw Panel and normalises it, returning the filled, z score
+    and min-max Panels and the age of every filled value"""
+    filled, age = panel.ffill(max_age)
+
+    return filled, z_norm(filled), min_max_norm(filled), age
+
+
+@instrument.stage()
+def build_outputs(df, max_age: dict = MAX_AGE, with_age: bool = False) -> tuple:
+    """Builds the forward filled data and its z score and min-max versions.
+
+    The data (df or Panel) is laid out as a Panel once, filled (carrying
+    each variable's observations for at most max_age years) and normalised
+    on that array. With with_age the age (in years) of every filled value is
+    also returned.
+    """
+    panel = df if isinstance(df, Panel) else Panel.from_frame(df.astype(float))
+    columns = None if isinstance(df, Panel) else df.columns
+    filled, z_scores, maxmin, age = _build_panels(panel, max_age)
+    outputs = [out.to_frame(columns=columns) for out in [filled, z_scores, maxmin]]
+    if with_age:
+        outputs.append(filled.copy(age).to_frame(columns=columns))
+
+    return tuple(outputs)
+
+
+def _read_output(file: str) -> pd.DataFrame:
+    """Reads one of the (subindex, variable, country) csv outputs"""
+    df = pd.read_csv(file, header = [0,1,2], index_col = [0], parse_dates=True,
+                     float_precision='round_trip')
+    df.index.name = None
+
+    return df
+
+
+def _same(new: np.ndarray, old: np.ndarray) -> np.ndarray:
+    """Flags equal values, treating nas as equal"""
+    return (new == old) | (np.isnan(new) & np.isnan(old))
+
+
+def _changed_rows(new: np.ndarray, old: np.ndarray) -> np.ndarray:
+    """Flags the dates of new that differ from old (dates missing from old
+    count as changed)"""
+    rows = np.ones(len(new), dtype=bool)
+    rows[:len(old)] = ~_same(new[:len(old)], old).all(axis=(1, 2))
+
+    return rows
+
+
+def _write_rows(panel: Panel, rows: np.ndarray, n_old: int, file: str, columns):
+    """Appends the flagged dates to file when they are all new, otherwise
+    rewrites it"""
+    if rows[:n_old].any():
+        panel.to_frame(columns=columns).to_csv(file)
+    else:
+        sub = Panel(panel.values[rows], panel.dates[rows], panel.variables, panel.countries, panel.mask)
+        sub.to_frame(columns=columns).to_csv(file, mode='a', header=False)
+
+
+# Binary panel stores (see storage.open_panel) holding the state the next
+# incremental_build compares against, and the outputs also written to
+# parquet stores (see storage.load)
+OUTPUTS = ['data', 'data_age', 'z_scores', 'maxmin']
+STORES = ['raw'] + OUTPUTS
+COLUMNAR = ['data', 'z_scores', 'maxmin']
+# Settings of the last build (the stores are rebuilt when they change)
+BUILD = 'build.json'
+
+
+def _write_stores(outputs: dict, out_path: str, columns):
+    """Writes outputs to binary panel stores and, for those in COLUMNAR and
+    if pyarrow is installed, to parquet stores"""
+    for name, out in outputs.items():
+        storage.write_panel(out, out_path+name)
+    try:
+        for name in COLUMNAR:
+            if name in outputs:
+                storage.write_columnar(outputs[name].to_frame(columns=columns), out_path+name+'.parquet')
+    except ImportError:
+        pass
+
+
+def _open_stores(out_path: str, settings: dict) -> dict:
+    """Opens the stores of a previous build (None if any is missing or it
+    was built with other settings)"""
+    if not all(os.path.exists(out_path+name+storage.META) and os.path.exists(out_path+name+'.csv')
+               for name in STORES) or not os.path.exists(out_path+BUILD):
+        return None
+    with open(out_path+BUILD) as f:
+        if json.load(f) != json.loads(json.dumps(settings)):
+            return None
+
+    return {name: storage.open_panel(out_path+name) for name in STORES}
+
+
+@instrument.stage()
+def incremental_build(df, out_path: str, max_age: dict = MAX_AGE) -> dict:
+    """Updates data.csv (and the ages of its values in data_age.csv),
+    z_scores.csv and maxmin.csv for the changed rows only.
+
+    The previous build is read from its binary panel stores (raw, data,
+    z_scores and maxmin), which are memory mapped rather than parsed. If the
+    raw data did not change nothing else is done. Otherwise the data is
+    filled again in one pass and, as the normalisations are cross sectional,
+    only the dates whose filled values changed are normalised again. The csv
+    outputs are appended to when only new dates changed and rewritten
+    otherwise, and the stores are rewritten. Any change to the columns or to
+    max_age (or missing previous outputs) triggers a full rebuild.
+
+    The data, z score and min-max outputs are also written as parquet
+    stores (see storage.load) when pyarrow is available.
+
+    Args:
+        df: pd.DataFrame (or Panel) with the merged (unfilled) data from
+            merge_sources.
+        out_path: str with the path for where the outputs are written.
+        max_age: dict with the maximum number of years each variable's last
+            observation is carried forward (see MAX_AGE).
+
+    Returns:
+        changes: dict with the changed 'dates' and 'variables', and the full
+            'outputs' (dict with the 'data', 'data_age', 'z_scores' and
+            'maxmin' Panels)
+    """
+    panel = df if isinstance(df, Panel) else Panel.from_frame(df.astype(float))
+    columns = None if isinstance(df, Panel) else df.columns
+    files = {name: out_path+name+'.csv' for name in STORES}
+    settings = {'max_age': max_age}
+    old = _open_stores(out_path, settings)
+    # Full rebuild if there are no previous outputs or their layout changed
+    if old is None or not (old['raw'].variables.equals(panel.variables)
+                           and old['raw'].countries.equals(panel.countries)
+                           and np.array_equal(old['raw'].mask, panel.mask)
+                           and panel.dates[:len(old['raw'].dates)].equals(old['raw'].dates)):
+        filled, z_scores, maxmin, age = _build_panels(panel, max_age)
+        outputs = {'data': filled, 'data_age': filled.copy(age), 'z_scores': z_scores, 'maxmin': maxmin}
+        for name, out in {'raw': panel, **outputs}.items():
+            out.to_frame(columns=columns).to_csv(files[name])
+        _write_stores({'raw': panel, **outputs}, out_path, columns)
+        with open(out_path+BUILD, 'w') as f:
+            json.dump(settings, f)
+        return {'dates': panel.dates, 'variables': panel.variables, 'outputs': outputs}
+    # Finding what changed in the raw data
+    n_old = len(old['raw'].dates)
+    cells = np.ones(panel.shape, dtype=bool)
+    cells[:n_old] = ~_same(panel.values[:n_old], old['raw'].values)
+    raw_rows = cells.any(axis=(1, 2))
+    changed_vars = panel.variables[(cells & panel.mask).any(axis=(0, 2))]
+    if not raw_rows.any():
+        return {'dates': panel.dates[:0], 'variables': changed_vars,
+                'outputs': {name: old[name] for name in OUTPUTS}}
+    # Forward filling in a single pass, so the staleness limits see the
+    # whole history, and finding the dates whose filled values changed
+    filled, age = panel.ffill(max_age)
+    age = filled.copy(age)
+    rows = _changed_rows(filled.values, old['data'].values)
+    out_rows = {'data': rows, 'data_age': _changed_rows(age.values, old['data_age'].values),
+                'z_scores': rows, 'maxmin': rows}
+    # Normalising the changed dates only
+    sub = Panel(filled.values[rows], filled.dates[rows], filled.variables, filled.countries, filled.mask)
+    outputs = {'data': filled, 'data_age': age}
+    for name, norm in [('z_scores', z_norm), ('maxmin', min_max_norm)]:
+        values = np.full(filled.shape, np.nan)
+        values[:n_old] = old[name].values
+        values[rows] = norm(sub).values
+        outputs[name] = filled.copy(values)
+    # Exporting
+    _write_rows(panel, raw_rows, n_old, files['raw'], columns)
+    for name, out in outputs.items():
+        _write_rows(out, out_rows[name], n_old, files[name], columns)
+    _write_stores({'raw': panel, **outputs}, out_path, columns)
+    changes = {'dates': panel.dates[raw_rows], 'variables': changed_vars, 'outputs': outputs}
+
+    return changes
+
+
 if __name__ == "__main__":
     # Setting the path for the raw data files
     raw_path = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/Raw Data/'
+    out_path = '/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/'
     # Building the dataset
-    wb = wb_import(raw_path)
-    wb_edu = wbedu_import(raw_path)
-    icrg = icrg_import(raw_path)
-    whc = whc_import(raw_path)
-    cult_exp = cult_goods_export(raw_path)
-    medals = olymp_import(raw_path)
-    emb = lowy_import(raw_path)
-    ofi = ofi_import(raw_path)
-    gci = gci_import(raw_path)
-    gdelt = gdelt_import(raw_path)
+    sources = run_importers(raw_path)
     # Merging
-    df ={}
-    df['institutions'] = icrg[['rule_of_law', 'gov_stability', 'dem_account', 'bur_effect', 'corruption']]
-    df['culture'] = pd.concat([wb[['int_tourists']], whc, cult_exp, medals], axis=1)
-    df['comercial'] = pd.concat([wb[['patents', 'trademarks']], ofi, gci], axis=1)
-    df['digital'] = wb[['internet', 'cellphones']]
-    df['global_reach'] = pd.concat([wb[['aid', 'migrants', 'refugees']], emb, gdelt], axis=1)
-    df['education'] = pd.concat([ wb[['ter_education', 'publications']], wb_edu], axis=1)
-    df = pd.concat(df, axis=1, names=['subindex'])
-    # Filling na forward
-    final_df = df.fillna(method='ffill')
-    # Normalising the data
-    z_scores = z_norm(final_df)
-    maxmin = min_max_norm(final_df)
-    # Exporting
-    final_df.to_csv('/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/data.csv')
-    z_scores.to_csv('/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/z_scores.csv')
-    maxmin.to_csv('/Users/talespadilha/Dropbox/Soft Power and FX Prediction/Data/maxmin.csv')
+    df = merge_sources(sources)
+    # Filling, normalising and exporting the dates that changed
+    changes = incremental_build(df, out_path, MAX_AGE)
+    # Run report (recorded when SOFT_POWER_INSTRUMENT=1)
+    if instrument.enabled():
+        instrument.report(out_path+'run_report.json')
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 10:41:52 2026
+
+@author: talespadilha
+"""
+
+import numpy as np
+import pandas as pd
+
+# Available estimators:
+#   'abs' - mean absolute log change, the measure behind fx_analysis.reer_vol
+#   'rolling' - sample standard deviation of log changes
+#   'realized' - square root of the sum of squared log changes
+#   'ewma' - RiskMetrics exponentially weighted volatility, with the window
+#            used as the span (alpha = 2/(window+1), as pandas ewm with
+#            adjust=False)
+ESTIMATORS = ('abs', 'rolling', 'realized', 'ewma')
+
+
+def log_returns(prices: pd.DataFrame) -> np.ndarray:
+    """Returns log changes (in %) as a contiguous (dates, currencies) array"""
+    values = np.log(prices.to_numpy(dtype=float))
+    r = np.full(values.shape, np.nan)
+    r[1:] = np.diff(values, axis=0)*100
+
+    return np.ascontiguousarray(r)
+
+
+def _trailing_sums(cum: np.ndarray, window: int) -> np.ndarray:
+    """Sums over trailing windows from a cumulative sum with a leading zero row"""
+    out = cum[1:].copy()
+    out[window:] -= cum[1:-window]
+
+    return out
+
+
+def _ewma(r2: np.ndarray, alphas: np.ndarray) -> np.ndarray:
+    """EWMA of r2 for several alphas at once, skipping missing values"""
+    n, k = r2.shape
+    out = np.full((len(alphas), n, k), np.nan)
+    state = np.full((len(alphas), k), np.nan)
+    a = alphas[:, None]
+    for t in range(n):
+        obs = ~np.isnan(r2[t])
+        new = np.where(np.isnan(state), r2[t], (1-a)*state + a*r2[t])
+        state = np.where(obs, new, state)
+        out[:, t] = state
+
+    return out
+
+
+def vol_panel(prices: pd.DataFrame, windows: tuple = (21, 63, 252),
+              estimators: tuple = ESTIMATORS, min_periods: int = None,
+              dropna: bool = True) -> pd.DataFrame:
+    """Computes every volatility estimator for every window in one pass.
+
+    Log changes are computed once into a contiguous array. Each rolling
+    estimator then comes from differences of cumulative sums (of returns,
+    squared returns, absolute returns and observation counts), so a window
+    costs O(n) regardless of its length, and all EWMA spans share a single
+    recursion over the dates.
+
+    Args:
+        prices: pd.DataFrame with dates as index and one price (or REER)
+            series per currency.
+        windows: tuple with the window lengths in observations.
+        estimators: tuple with the estimators from ESTIMATORS.
+        min_periods: int with the minimum observations in a window; defaults
+            to the window length.
+        dropna: bool for dropping missing estimates.
+
+    Returns:
+        df: pd.DataFrame indexed by (date, currency, estimator, window) with
+            the volatility (in %) in the 'vol' column
+    """
+    r = log_returns(prices)
+    obs = ~np.isnan(r)
+    r0 = np.where(obs, r, 0)
+    n, k = r.shape
+    zero = np.zeros((1, k))
+    # Cumulative sums shared by all windows
+    cum = {}
+    cum['n'] = np.concatenate([zero, np.cumsum(obs, axis=0)])
+    cum['abs'] = np.concatenate([zero, np.cumsum(np.abs(r0), axis=0)])
+    cum['sq'] = np.concatenate([zero, np.cumsum(r0**2, axis=0)])
+    # Centring by the full sample mean keeps the rolling variance accurate
+    centred = np.where(obs, r - np.nanmean(r, axis=0), 0)
+    cum['sum'] = np.concatenate([zero, np.cumsum(centred, axis=0)])
+    cum['csq'] = np.concatenate([zero, np.cumsum(centred**2, axis=0)])
+    vols = np.full((len(estimators), len(windows), n, k), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for j, window in enumerate(windows):
+            count = _trailing_sums(cum['n'], window)
+            enough = count >= (window if min_periods is None else min_periods)
+            for i, est in enumerate(estimators):
+                if est == 'abs':
+                    vol = _trailing_sums(cum['abs'], window)/count
+                elif est == 'rolling':
+                    s1 = _trailing_sums(cum['sum'], window)
+                    s2 = _trailing_sums(cum['csq'], window)
+                    vol = np.sqrt(np.maximum(s2 - s1**2/count, 0)/(count-1))
+                elif est == 'realized':
+                    vol = np.sqrt(_trailing_sums(cum['sq'], window))
+                elif est == 'ewma':
+                    continue
+                else:
+                    raise ValueError(f"Unknown estimator: {est}")
+                vols[i, j] = np.where(enough, vol, np.nan)
+        if 'ewma' in estimators:
+            alphas = 2/(np.asarray(windows, dtype=float)+1)
+            ewma = np.sqrt(_ewma(np.where(obs, r**2, np.nan), alphas))
+            vols[list(estimators).index('ewma')] = ewma
+    # Tidy (date, currency, estimator, window) panel
+    index = pd.MultiIndex.from_product([prices.index, prices.columns, list(estimators), list(windows)],
+                                       names=['date', 'currency', 'estimator', 'window'])
+    df = pd.DataFrame({'vol': vols.transpose(2, 3, 0, 1).ravel()}, index=index)
+    if dropna:
+        df = df.dropna()
+
+    return df